@@ -0,0 +1,67 @@
+"""Lookups through the cookie broker, against cache hits of get_cookies.
+
+The broker logs in to the mock server with the browserless engine, the
+lookups go through its Unix socket like those of another process.
+
+    python benchmarks/bench_broker.py -n 2000
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+from timeit import default_timer as timer
+
+import ruclogin.ruclogin as rl
+from mock_ruc import MockRUC
+from ruclogin.broker import BrokerClient, CookieBroker
+
+
+def latencies(fn, n):
+    costs = []
+    for _ in range(n):
+        tic = timer()
+        fn()
+        costs.append(timer() - tic)
+    costs.sort()
+    return statistics.mean(costs), costs[int(len(costs) * 0.99)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", type=int, default=2000)
+    args = parser.parse_args()
+    with MockRUC() as mock, tempfile.TemporaryDirectory() as tmp:
+        mock.patch(rl)
+        rl.ROOT = tmp
+        account = {"username": "2021201212", "password": "ABC12345"}
+        with CookieBroker(os.path.join(tmp, "broker.sock"), engine="http") as broker:
+            threading.Thread(target=broker.serve_forever, daemon=True).start()
+            client = BrokerClient(broker.address)
+            tic = timer()
+            for domain in ["v", "jw"]:
+                cookies = client.get(domain, **account)
+                assert rl.check_cookies(cookies, domain), cookies
+            print("first lookups, with logins: {:.3f}s".format(timer() - tic))
+            logins = mock.state.counters.get("login", 0)
+
+            for domain in ["v", "jw"]:
+                mean, p99 = latencies(lambda: client.get(domain, **account), args.n)
+                print("broker     {:>2}: mean {:7.1f}us, p99 {:7.1f}us".format(domain, mean * 1e6, p99 * 1e6))
+                mean, p99 = latencies(
+                    lambda: rl.get_cookies(domain=domain, engine="http", broker=False, **account),
+                    args.n,
+                )
+                print("disk cache {:>2}: mean {:7.1f}us, p99 {:7.1f}us".format(domain, mean * 1e6, p99 * 1e6))
+
+            tic = timer()
+            cookies = client.get("v", refresh=True, **account)
+            assert rl.check_cookies(cookies, "v"), cookies
+            print("lookup after refresh=True: {:.3f}s".format(timer() - tic))
+            print("form logins after the first lookups:", mock.state.counters.get("login", 0) - logins)
+            print("broker:", {k: v for k, v in client.stats().items() if k != "metrics"})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Latency of check_cookies for jw, the liveness probe against the detailed ranking query,
+and of checking --many cookies one by one against check_cookies_many.
+
+The mock ranking query costs --cost seconds per semester, like a backend
+that has to collect every semester it is asked for.
+
+    python benchmarks/bench_check_cookies.py -n 50
+"""
+
+import argparse
+import statistics
+import tempfile
+from timeit import default_timer as timer
+
+import ruclogin.ruclogin as rl
+from mock_ruc import MockRUC
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", type=int, default=20)
+    parser.add_argument("--cost", type=float, default=0.005)
+    parser.add_argument("--many", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+    with MockRUC(ranking_cost=args.cost) as mock, tempfile.TemporaryDirectory() as tmp:
+        mock.patch(rl)
+        rl.ROOT = tmp
+        cookies = rl.get_cookies(
+            cache=False,
+            domain="jw",
+            username="2021201212",
+            password="ABC12345",
+            engine="http",
+        )
+        for detail in [False, True]:
+            costs = []
+            for _ in range(args.n):
+                tic = timer()
+                assert rl.check_cookies(cookies, "jw", detail=detail)
+                costs.append(timer() - tic)
+            print(
+                "detail={!s:<5}: median {:.1f}ms, max {:.1f}ms".format(
+                    detail, statistics.median(costs) * 1000, max(costs) * 1000
+                )
+            )
+        assert not rl.check_cookies({"SESSION": "x", "token": "x"}, "jw")
+
+        v_cookies = rl.get_cookies(domain="v", username="2021201212", engine="http")
+        items = [(cookies, "jw"), (v_cookies, "v")] * (args.many // 2)
+        tic = timer()
+        for item_cookies, domain in items:
+            assert rl.check_cookies(item_cookies, domain)
+        print("{} checks one by one:    {:.3f}s".format(len(items), timer() - tic))
+        tic = timer()
+        results = rl.check_cookies_many(items, concurrency=args.concurrency)
+        assert all(result["status"] == "valid" for result in results), results
+        print(
+            "{} checks, concurrency {}: {:.3f}s".format(len(items), args.concurrency, timer() - tic)
+        )
+
+
+if __name__ == "__main__":
+    main()
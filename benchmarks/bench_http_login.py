@@ -0,0 +1,94 @@
+"""Log in to the mock server with the browserless engine.
+
+Cold logins fill the form, warm ones find the session remembered in the cache still valid.
+
+    python benchmarks/bench_http_login.py -n 20
+"""
+
+import argparse
+import resource
+import statistics
+import tempfile
+from timeit import default_timer as timer
+
+import ruclogin.ruclogin as rl
+from mock_ruc import MockRUC
+from ruclogin import metrics
+from ruclogin.ocr import get_memo
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", type=int, default=10)
+    parser.add_argument(
+        "--captcha-pool", type=int, default=0, help="serve codes from a fixed set of images"
+    )
+    parser.add_argument("--metrics", choices=["prometheus", "json"], help="print the phase timings and counters")
+    args = parser.parse_args()
+    with MockRUC(captcha_pool=args.captcha_pool) as mock, tempfile.TemporaryDirectory() as tmp:
+        mock.patch(rl)
+        rl.ROOT = tmp
+        rl.http_init()  # the OCR model is loaded once, not per login
+        for warm in [False, True]:
+            if warm:  # a v session to remember, the cold jw logins left none
+                rl.regain_all_cookies(["v"], "2021201212", "ABC12345", "http")
+            for domain in ["v", "jw"]:
+                costs = []
+                for _ in range(args.n):
+                    if not warm:
+                        rl.clear_cookies("2021201212")  # nothing to remember
+                    remembered = mock.state.counters.get("remembered", 0)
+                    tic = timer()
+                    if warm:  # log in again, but reuse the session remembered by the last login
+                        cookies = rl.regain_all_cookies([domain], "2021201212", "ABC12345", "http")[domain]
+                    else:
+                        cookies = rl.get_cookies(
+                            cache=False,
+                            domain=domain,
+                            username="2021201212",
+                            password="ABC12345",
+                            engine="http",
+                        )
+                    costs.append(timer() - tic)
+                    assert rl.check_cookies(cookies, domain), cookies
+                    if warm:
+                        assert mock.state.counters.get("remembered", 0) > remembered, "the session was not remembered"
+                print(
+                    "{} {:>2}: mean {:.3f}s, max {:.3f}s".format(
+                        "warm" if warm else "cold", domain, statistics.mean(costs), max(costs)
+                    )
+                )
+        costs = []
+        captchas = mock.state.counters["captcha"]
+        for _ in range(args.n):
+            rl.clear_cookies("2021201212")
+            tic = timer()
+            all_cookies = rl.get_all_cookies(
+                domains=["v", "jw"],
+                cache=False,
+                username="2021201212",
+                password="ABC12345",
+                engine="http",
+            )
+            costs.append(timer() - tic)
+            for domain, cookies in all_cookies.items():
+                assert rl.check_cookies(cookies, domain), cookies
+        print(
+            "cold v+jw with one login: mean {:.3f}s, max {:.3f}s, {:.1f} captchas per call".format(
+                statistics.mean(costs),
+                max(costs),
+                (mock.state.counters["captcha"] - captchas) / args.n,
+            )
+        )
+        print("counters:", mock.state.counters)
+        print("captcha memo:", get_memo().stats())
+        if args.metrics == "prometheus":
+            print(metrics.to_prometheus(), end="")
+        elif args.metrics == "json":
+            print(metrics.to_json(indent=1))
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"peak RSS of this process: {rss:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Import time of ruclogin, and the modules a cache hit pulls in.
+
+Exits with 1 if a cache-hit get_cookies loads the OCR or browser stack.
+
+    python benchmarks/bench_import.py
+"""
+
+import argparse
+import pickle
+import statistics
+import subprocess
+import sys
+import tempfile
+from timeit import default_timer as timer
+
+HEAVY_MODULES = [
+    "ddddocr",
+    "onnxruntime",
+    "selenium",
+    "webdriver_manager",
+]
+
+
+def run_time(code, n):
+    costs = []
+    for _ in range(n):
+        tic = timer()
+        subprocess.run([sys.executable, "-c", code], check=True)
+        costs.append(timer() - tic)
+    return statistics.median(costs)
+
+
+def cache_hit_modules():
+    import ruclogin.ruclogin as rl
+    from mock_ruc import MockRUC
+
+    with MockRUC() as mock, tempfile.TemporaryDirectory() as tmp:
+        mock.patch(rl)
+        rl.ROOT = tmp
+        mock.state.access_tokens["token"] = "2021201212"
+        cookies = {"access_token": "token"}
+        with open(rl.cookies_path("v", "2021201212"), "wb") as f:
+            pickle.dump(cookies, f)  # a cache without freshness record, so it is validated
+        assert rl.get_cookies(domain="v", username="2021201212") == cookies
+        assert mock.state.counters.get("login", 0) == 0, "cache missed"
+    return [m for m in HEAVY_MODULES if m in sys.modules]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", type=int, default=5)
+    args = parser.parse_args()
+    print("python -c 'pass':              {:.3f}s".format(run_time("pass", args.n)))
+    print(
+        "python -c 'import ruclogin':   {:.3f}s".format(
+            run_time("import ruclogin", args.n)
+        )
+    )
+    loaded = cache_hit_modules()
+    if loaded:
+        print(f"FAIL: a cache hit loaded {', '.join(loaded)}")
+        sys.exit(1)
+    print("OK: a cache hit loads none of " + ", ".join(HEAVY_MODULES))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""Page loads of the login page and the jw index page, with and without the lean browser.
+
+Needs Chrome or Edge as set in config.ini. The browser cache is disabled,
+like in the fresh browser of a first login, and bytes are counted by the mock.
+
+    python benchmarks/bench_lean_browser.py -n 5
+"""
+
+import argparse
+import statistics
+import tempfile
+from timeit import default_timer as timer
+
+import ruclogin.ruclogin as rl
+from mock_ruc import MockRUC
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", type=int, default=5)
+    args = parser.parse_args()
+    with MockRUC() as mock, tempfile.TemporaryDirectory() as tmp:
+        mock.patch(rl)
+        rl.ROOT = tmp
+        pages = {
+            "login page": f"{mock.v_url}/auth/login",
+            "jw index": f"{mock.jw_url}/Njw2017/index.html",
+        }
+        for lean in [False, True]:
+            loginer = rl.RUC_LOGIN(lean=lean)
+            loginer.driver.execute_cdp_cmd("Network.setCacheDisabled", {"cacheDisabled": True})
+            for name, url in pages.items():
+                costs, sizes = [], []
+                for _ in range(args.n):
+                    before = mock.state.counters.get("bytes", 0)
+                    tic = timer()
+                    loginer.driver.get(url)
+                    costs.append(timer() - tic)
+                    sizes.append(mock.state.counters.get("bytes", 0) - before)
+                print(
+                    "lean={!s:<5} {:<10}: mean {:.3f}s, {:.0f} KB".format(
+                        lean, name, statistics.mean(costs), statistics.mean(sizes) / 1024
+                    )
+                )
+            loginer.close()
+
+
+if __name__ == "__main__":
+    main()
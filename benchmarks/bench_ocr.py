@@ -0,0 +1,67 @@
+"""Captchas per second of the shared OCR, in threads and through the OCR server.
+
+    python benchmarks/bench_ocr.py -n 200 --threads 1 2 4 8
+"""
+
+import argparse
+import os
+import resource
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from timeit import default_timer as timer
+
+from mock_ruc import gen_captcha
+
+from ruclogin.ocr import OCRServer, RemoteOCR, SharedOCR
+
+
+def throughput(ocr, imgs, threads, batch=1):
+    batches = [imgs[i : i + batch] for i in range(0, len(imgs), batch)]
+    tic = timer()
+    with ThreadPoolExecutor(threads) as executor:
+        for _ in executor.map(ocr.classify_many, batches):
+            pass
+    return len(imgs) / (timer() - tic)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", type=int, default=200)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+    imgs = [gen_captcha("abcd") for _ in range(args.n)]
+    print(f"{os.cpu_count()} cpus, {args.n} captchas")
+
+    tic = timer()
+    ocr = SharedOCR()
+    print(
+        "model load {:.3f}s, rss {:.0f}MB".format(
+            timer() - tic, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        )
+    )
+    ocr.classify_many(imgs[:5])  # warm up
+    for settings in [{}, {"intra_op_threads": 1}]:
+        shared = SharedOCR(**settings) if settings else ocr
+        for threads in args.threads:
+            print(
+                "{:<24} {:>2} threads: {:6.1f} captchas/s".format(
+                    str(settings or "default"), threads, throughput(shared, imgs, threads)
+                )
+            )
+
+    server = OCRServer(("127.0.0.1", 0))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    remote = RemoteOCR(server.address)
+    remote.classification(imgs[0])
+    for batch in [1, 8]:
+        for threads in args.threads:
+            print(
+                "server, batch {:<2}          {:>2} threads: {:6.1f} captchas/s".format(
+                    batch, threads, throughput(remote, imgs, threads, batch)
+                )
+            )
+    server.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""Many processes asking for the same cookies at once should cost one login.
+
+    python benchmarks/bench_single_flight.py -p 8
+"""
+
+import argparse
+import multiprocessing
+import os
+import tempfile
+from timeit import default_timer as timer
+
+import ruclogin.ruclogin as rl
+from mock_ruc import MockRUC
+
+
+def worker(v_url, jw_url, domain):
+    rl.V_URL, rl.JW_URL = v_url, jw_url
+    return rl.get_cookies(
+        domain=domain, username="2021201212", password="ABC12345", engine="http"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-p", type=int, default=8)
+    parser.add_argument("--domain", default="jw")
+    args = parser.parse_args()
+    with MockRUC() as mock, tempfile.TemporaryDirectory() as tmp:
+        os.environ["RUCLOGIN_CACHE_DIR"] = tmp
+        tic = timer()
+        with multiprocessing.get_context("spawn").Pool(args.p) as pool:
+            results = pool.starmap(
+                worker, [(mock.v_url, mock.jw_url, args.domain)] * args.p
+            )
+        toc = timer()
+        logins = mock.state.counters.get("login", 0) - mock.state.counters.get(
+            "wrong_code", 0
+        )
+        print(f"{args.p} processes in {toc - tic:.3f}s, successful logins: {logins}")
+        assert all(r == results[0] for r in results), "processes got different cookies"
+        assert logins == 1, "processes did not share one login"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Accuracy of code recognition over a labeled corpus, and what it costs a login.
+
+The corpus is a directory of code images named by their code, e.g. aBcD.png
+or aBcD_2.png, or the images that logged in from a captcha memo file.
+Without either, --generate images are drawn like the mock server.
+
+For every rule it prints the share of images submitted instead of refreshed,
+the accuracy of the submitted codes, and from those the expected number of
+image refreshes and form submits per successful login.
+
+    python benchmarks/eval_ocr.py --dir captchas/ --thresholds 0 0.1 0.3 0.5
+    python benchmarks/eval_ocr.py --memo ../ruclogin/captcha_memo.pkl
+"""
+
+import argparse
+import os
+import random
+import string
+
+from mock_ruc import gen_captcha
+
+from ruclogin.ocr import CodeMemo, SharedOCR
+from ruclogin.ruclogin import is_valid_code
+
+
+def load_corpus(path):
+    corpus = []
+    for name in sorted(os.listdir(path)):
+        stem, ext = os.path.splitext(name)
+        if ext.lower() not in [".png", ".jpg", ".jpeg", ".gif"]:
+            continue
+        with open(os.path.join(path, name), "rb") as f:
+            corpus.append((stem.split("_")[0], f.read()))
+    return corpus
+
+
+def generate_corpus(n, seed=0):
+    random.seed(seed)
+    codes = ["".join(random.choices(string.ascii_letters, k=4)) for _ in range(n)]
+    return [(code, gen_captcha(code)) for code in codes]
+
+
+def report(name, results, ignore_case):
+    """results: [(submitted, code, label)]"""
+    same = (lambda a, b: a.lower() == b.lower()) if ignore_case else str.__eq__
+    submitted = [(code, label) for ok, code, label in results if ok]
+    accept = len(submitted) / len(results)
+    accuracy = sum(same(code, label) for code, label in submitted) / max(len(submitted), 1)
+    if accept and accuracy:
+        submits = 1 / accuracy
+        refreshes = (1 / accept - 1) * submits
+        cost = "{:8.2f} {:9.2f}".format(refreshes, submits)
+    else:
+        cost = "{:>8} {:>9}".format("inf", "inf")
+    print("{:<22} {:7.1%} {:9.1%} {}".format(name, accept, accuracy, cost))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dir", help="directory of labeled code images")
+    parser.add_argument("--memo", help="captcha_memo.pkl in the cache directory")
+    parser.add_argument("--generate", type=int, default=200)
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0, 0.1, 0.3, 0.5, 0.7])
+    parser.add_argument("--ignore-case", action="store_true", help="the server ignores case")
+    args = parser.parse_args()
+    if args.dir:
+        corpus = load_corpus(args.dir)
+    elif args.memo:
+        corpus = CodeMemo(args.memo).labeled()
+    else:
+        corpus = generate_corpus(args.generate)
+    ocr = SharedOCR(ignore_case=args.ignore_case)
+    raw, decoded = [], []
+    for label, img in corpus:
+        raw.append((ocr.classification(img), label))
+        decoded.append((*ocr.recognize(img), label))
+
+    print(f"{len(corpus)} images\n")
+    print("{:<22} {:>7} {:>9} {:>8} {:>9}".format("rule", "submit", "accuracy", "refresh", "submits"))
+    report("4 letters (before)", [(is_valid_code(text), text, label) for text, label in raw], args.ignore_case)
+    for threshold in args.thresholds:
+        report(
+            f"confidence >= {threshold}",
+            [(confidence >= threshold, code, label) for code, confidence, label in decoded],
+            args.ignore_case,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,419 @@
+"""A local stand-in for v.ruc.edu.cn and jw.ruc.edu.cn.
+
+v is served on localhost and jw on 127.0.0.1, so that the two sites keep
+separate cookie jars like the real ones. Run it alone to poke at it by hand:
+
+    python benchmarks/mock_ruc.py
+"""
+
+import base64
+import io
+import json
+import random
+import string
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qs, urlencode, urlparse
+
+from PIL import Image, ImageDraw, ImageFont
+
+WRONG_CODE = "验证码不正确或已失效,请重试！"
+NO_USER = "用户不存在"
+WRONG_PASSWORD = "用户名或密码不正确"
+
+# the pages pull in assets of roughly the real sizes, so that a browser has something to block
+ASSETS = """
+<link rel="stylesheet" href="/static/app.css">
+<link rel="icon" href="/static/favicon.ico">
+<script src="/static/app.js"></script>
+<style>@font-face {font-family: ruc; src: url(/static/font.woff2);} body {font-family: ruc;}</style>
+"""
+
+# The form is laid out at the XPaths RUC_LOGIN.find_form looks for, and talks to the
+# same JSON api as RUC_HTTP_LOGIN: a failed login shows its reason and a new code.
+LOGIN_PAGE = f"""<!DOCTYPE html>
+<html><head><title>统一身份认证</title>{ASSETS}</head>
+<body><img src="/static/background.jpg">
+<div><form onsubmit="return false">
+  <div>mock v.ruc.edu.cn</div>
+  <div>账号登录</div>
+  <div><input name="username" placeholder="学工号"></div>
+  <div><input name="password" type="password" placeholder="密码"></div>
+  <div style="display: none"><input name="twofactor_password"></div>
+  <div><input name="code" placeholder="验证码"></div>
+  <div><img id="codeImg" alt="验证码"></div>
+  <div></div>
+  <div></div>
+  <div></div>
+  <div id="alter" style="display: none"></div>
+  <div><button id="loginButton" type="button">登录</button></div>
+  <div><span><div id="rememberMe">记住我</div></span></div>
+</form></div>
+<script>
+var form = document.forms[0];
+var codeImg = document.getElementById("codeImg");
+var alter = document.getElementById("alter");
+var rememberMe = false;
+var captchaId = null;
+function refresh() {{
+    return fetch("/auth/captcha").then(function (r) {{ return r.json(); }}).then(function (data) {{
+        captchaId = data.id;
+        codeImg.src = data.b64s;
+    }});
+}}
+codeImg.onclick = refresh;
+document.getElementById("rememberMe").onclick = function () {{ rememberMe = !rememberMe; }};
+document.getElementById("loginButton").onclick = function () {{
+    var redirect = new URLSearchParams(location.search).get("redirect_uri") || "/";
+    fetch("/auth/login", {{
+        method: "POST",
+        headers: {{"Content-Type": "application/json"}},
+        body: JSON.stringify({{
+            username: "ruc:" + form.username.value,
+            password: form.password.value,
+            code: form.code.value,
+            remember_me: String(rememberMe),
+            redirect_uri: redirect,
+            twofactor_password: "",
+            twofactor_recovery: "",
+            token: "",
+            captcha_id: captchaId
+        }})
+    }}).then(function (r) {{
+        return r.json().then(function (data) {{
+            if (r.ok) {{
+                location.href = data.redirect_uri;
+                return;
+            }}
+            alter.innerText = data.error_description;
+            alter.style.display = "block";
+            refresh();
+        }});
+    }});
+}};
+refresh();
+</script>
+</body></html>
+"""
+
+HOME_PAGE = """<!DOCTYPE html>
+<html><head><title>微人大</title></head>
+<body><div>mock v.ruc.edu.cn home</div></body></html>
+"""
+
+INDEX_PAGE = f"""<!DOCTYPE html>
+<html><head><title>教务系统</title>{ASSETS}</head>
+<body><img src="/static/banner.png"><div>mock jw.ruc.edu.cn</div></body></html>
+"""
+
+STATIC = {
+    "app.css": ("text/css", b"body{margin:0}\n" * 2000),
+    "app.js": ("application/javascript", b"void 0;\n" * 4000),
+    "font.woff2": ("font/woff2", bytes(80_000)),
+    "favicon.ico": ("image/x-icon", bytes(4_000)),
+    "background.jpg": ("image/jpeg", bytes(300_000)),
+    "banner.png": ("image/png", bytes(60_000)),
+}
+
+
+def gen_captcha(code):
+    img = Image.new("RGB", (120, 40), (255, 255, 255))
+    draw = ImageDraw.Draw(img)
+    draw.text((10, 2), code, fill=(20, 20, 120), font=ImageFont.load_default(size=30))
+    for _ in range(2):
+        draw.line(
+            [(random.randint(0, 120), random.randint(0, 40)) for _ in range(2)],
+            fill=(150, 150, 150),
+        )
+    buf = io.BytesIO()
+    img.save(buf, "PNG")
+    return buf.getvalue()
+
+
+class MockState:
+    """Accounts, issued captchas and sessions, shared by the v and jw servers."""
+
+    def __init__(self, accounts, ranking_cost=0.0, captcha_pool=0):
+        self.accounts = dict(accounts)
+        self.ranking_cost = ranking_cost  # seconds the ranking query spends per semester
+        # with captcha_pool, codes are drawn from a fixed set of images, so images repeat
+        self.captcha_pool = [
+            (code, gen_captcha(code))
+            for code in ("".join(random.choices(string.ascii_letters, k=4)) for _ in range(captcha_pool))
+        ]
+        self.lock = threading.Lock()
+        self.captchas = {}  # captcha_id -> code
+        self.access_tokens = {}  # access_token -> username
+        self.oauth_codes = {}  # code -> username
+        self.jw_sessions = {}  # SESSION -> (token, username)
+        self.counters = {}
+
+    def count(self, name):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + 1
+
+    def new_captcha(self):
+        """Returns (captcha_id, png bytes)."""
+        if self.captcha_pool:
+            code, img = random.choice(self.captcha_pool)
+        else:
+            code = "".join(random.choices(string.ascii_letters, k=4))
+            img = gen_captcha(code)
+        captcha_id = uuid.uuid4().hex
+        with self.lock:
+            self.captchas[captcha_id] = code
+        self.count("captcha")
+        return captcha_id, img
+
+    def check_login(self, username, password, captcha_id, code):
+        """Returns (access_token, None) on success else (None, failed reason)."""
+        self.count("login")
+        with self.lock:
+            expected = self.captchas.pop(captcha_id, None)
+        if expected is None or expected.lower() != (code or "").lower():
+            self.count("wrong_code")
+            return None, WRONG_CODE
+        username = username.split(":", 1)[-1]
+        if username not in self.accounts:
+            return None, NO_USER
+        if self.accounts[username] != password:
+            return None, WRONG_PASSWORD
+        token = uuid.uuid4().hex[:22]
+        with self.lock:
+            self.access_tokens[token] = username
+        return token, None
+
+
+class Handler(BaseHTTPRequestHandler):
+    state: MockState
+    server_version = "mock-ruc"
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def url(self):
+        return urlparse(self.path)
+
+    @property
+    def query(self):
+        return {k: v[0] for k, v in parse_qs(self.url.query).items()}
+
+    @property
+    def cookies(self):
+        cookie = SimpleCookie(self.headers.get("Cookie", ""))
+        return {k: m.value for k, m in cookie.items()}
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        try:
+            return json.loads(body or b"{}")
+        except ValueError:
+            return {}
+
+    def send(self, status=200, body=b"", content_type="text/html", headers=()):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        with self.state.lock:
+            self.state.counters["bytes"] = self.state.counters.get("bytes", 0) + len(body)
+        self.send_response(status)
+        self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, data, status=200, headers=()):
+        self.send(status, json.dumps(data, ensure_ascii=False), "application/json", headers)
+
+    def redirect(self, location, headers=()):
+        self.send(302, b"", headers=[("Location", location), *headers])
+
+    def send_static(self):
+        """Serve /static/*, returns False if the path is not a static file."""
+        name = self.url.path[len("/static/"):]
+        if not self.url.path.startswith("/static/") or name not in STATIC:
+            return False
+        self.state.count("static")
+        content_type, body = STATIC[name]
+        self.send(200, body, content_type)
+        return True
+
+
+class VHandler(Handler):
+    jw_url: str
+
+    def do_GET(self):
+        path = self.url.path
+        if self.send_static():
+            return
+        if path == "/auth/login":
+            self.state.count("login_page")
+            if self.state.access_tokens.get(self.cookies.get("access_token")):
+                # a remembered session skips the form, like the real SSO
+                self.state.count("remembered")
+                self.redirect(self.query.get("redirect_uri") or "/")
+                return
+            self.send(200, LOGIN_PAGE, headers=[("Set-Cookie", f"session={uuid.uuid4().hex}; Path=/")])
+        elif path == "/auth/captcha":
+            captcha_id, img = self.state.new_captcha()
+            b64s = "data:image/png;base64," + base64.b64encode(img).decode()
+            self.send_json({"id": captcha_id, "b64s": b64s})
+        elif path == "/oauth2/authorize":
+            username = self.state.access_tokens.get(self.cookies.get("access_token"))
+            if username is None:
+                self.redirect("/auth/login")
+                return
+            code = uuid.uuid4().hex
+            with self.state.lock:
+                self.state.oauth_codes[code] = username
+            query = urlencode({"code": code, "state": self.query.get("state", "")})
+            self.redirect(f"{self.query['redirect_uri']}?{query}")
+        elif path == "/":
+            self.send(200, HOME_PAGE)
+        elif path == "/v3/api/me/roles":
+            self.state.count("roles")
+            username = self.state.access_tokens.get(self.cookies.get("access_token"))
+            if username is None:
+                self.send_json({"code": 401, "message": "unauthorized"}, 401)
+                return
+            self.send_json(
+                {"data": [{"departmentname": "信息学院", "username": username}]}
+            )
+        else:
+            self.send(404, "not found")
+
+    def do_POST(self):
+        if self.url.path != "/auth/login":
+            self.send(404, "not found")
+            return
+        data = self.read_json()
+        token, reason = self.state.check_login(
+            data.get("username", ""),
+            data.get("password", ""),
+            data.get("captcha_id"),
+            data.get("code"),
+        )
+        if reason:
+            self.send_json({"error_description": reason}, 400)
+            return
+        self.send_json(
+            {"redirect_uri": data.get("redirect_uri", "/")},
+            headers=[
+                ("Set-Cookie", f"access_token={token}; Path=/; HttpOnly"),
+                ("Set-Cookie", f"tiup_uid={uuid.uuid4().hex[:24]}; Path=/"),
+                ("Set-Cookie", "is_simple=1; Path=/"),
+            ],
+        )
+
+
+class JWHandler(Handler):
+    def do_GET(self):
+        path = self.url.path
+        if self.send_static():
+            return
+        if path == "/secService/oauthlogin":
+            with self.state.lock:
+                username = self.state.oauth_codes.pop(self.query.get("code"), None)
+            if username is None:
+                self.send(403, "invalid code")
+                return
+            session, token = uuid.uuid4().hex, uuid.uuid4().hex
+            with self.state.lock:
+                self.state.jw_sessions[session] = (token, username)
+            self.redirect(
+                "/Njw2017/index.html",
+                headers=[
+                    ("Set-Cookie", f"SESSION={session}; Path=/; HttpOnly"),
+                    ("Set-Cookie", f"token={token}; Path=/"),
+                ],
+            )
+        elif path == "/Njw2017/index.html":
+            self.send(200, INDEX_PAGE)
+        else:
+            self.send(404, "not found")
+
+    def do_POST(self):
+        path = self.url.path
+        if path.endswith("/professionalRankingQuery"):
+            self.state.count("ranking")
+            session = self.state.jw_sessions.get(self.cookies.get("SESSION"))
+            if session is None or session[0] != self.headers.get("TOKEN"):
+                self.send_json({"code": 401, "data": None}, 401)
+                return
+            semesters = self.read_json().get("jczy013id", "").split(",")
+            time.sleep(self.state.ranking_cost * len(semesters))
+            self.send_json(
+                {
+                    "data": [
+                        {
+                            "ndzy_name": "计算机科学与技术",
+                            "xs_name": session[1],
+                            "sdxf": 30 * len(semesters),
+                            "countnum": 12 * len(semesters),
+                            "pjxfjd": 3.9,
+                            "pm": 2,
+                        }
+                    ]
+                }
+            )
+        else:
+            self.send(404, "not found")
+
+
+class MockRUC:
+    """Serve v and jw in background threads.
+
+    with MockRUC() as mock:
+        mock.patch(ruclogin.ruclogin)
+        ruclogin.get_cookies(cache=False, engine="http")
+    """
+
+    def __init__(self, accounts=None, ranking_cost=0.0, captcha_pool=0):
+        self.state = MockState(
+            accounts or {"2021201212": "ABC12345"}, ranking_cost, captcha_pool
+        )
+        jw_handler = type("JW", (JWHandler,), {"state": self.state})
+        self.jw_server = ThreadingHTTPServer(("127.0.0.1", 0), jw_handler)
+        self.jw_url = f"http://127.0.0.1:{self.jw_server.server_port}"
+        v_handler = type("V", (VHandler,), {"state": self.state, "jw_url": self.jw_url})
+        self.v_server = ThreadingHTTPServer(("localhost", 0), v_handler)
+        self.v_url = f"http://localhost:{self.v_server.server_port}"
+        self.threads = []
+
+    def start(self):
+        for server in (self.v_server, self.jw_server):
+            thread = threading.Thread(target=server.serve_forever, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        return self
+
+    def stop(self):
+        for server in (self.v_server, self.jw_server):
+            server.shutdown()
+            server.server_close()
+
+    def patch(self, module):
+        """Point module (ruclogin.ruclogin) at this server."""
+        module.V_URL = self.v_url
+        module.JW_URL = self.jw_url
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    mock = MockRUC().start()
+    print(f"v:  {mock.v_url}\njw: {mock.jw_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        mock.stop()
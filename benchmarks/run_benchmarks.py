@@ -0,0 +1,172 @@
+"""Logins against the mock server for every engine and configuration, to catch regressions offline.
+
+Each configuration runs in its own process, so that its peak RSS is its own.
+One untimed login loads the OCR model (and starts the browser) first, then
+every timed login reports its latency, form submits and OCR inferences:
+
+    python benchmarks/run_benchmarks.py -n 20
+    python benchmarks/run_benchmarks.py -n 20 --configs http http-warm --json after.json --baseline before.json
+
+The selenium configurations need Chrome or Edge as set in config.ini, and are
+skipped where they cannot start. With --baseline, a p50/p95 latency or a mean
+number of submits or OCR calls more than --tolerance above the baseline is a
+regression, and the exit status is 1.
+"""
+
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+from timeit import default_timer as timer
+
+CONFIGS = {
+    # name: (engine, domains, cold, RUC_LOGIN kwargs, MockRUC kwargs)
+    "http": ("http", ["v"], True, {}, {}),
+    "http-jw": ("http", ["jw"], True, {}, {}),
+    "http-v+jw": ("http", ["v", "jw"], True, {}, {}),
+    "http-warm": ("http", ["v"], False, {}, {}),
+    "http-memo": ("http", ["v"], True, {}, {"captcha_pool": 10}),
+    "selenium": ("selenium", ["v"], True, {}, {}),
+    "selenium-jw": ("selenium", ["jw"], True, {}, {}),
+    "selenium-warm": ("selenium", ["v"], False, {}, {}),
+    "selenium-no-pipeline": ("selenium", ["v"], True, {"pipeline": False}, {}),
+    "selenium-lean": ("selenium", ["v"], True, {"lean": True}, {}),
+}
+USERNAME, PASSWORD = "2021201212", "ABC12345"
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def worker(name, n):
+    """Run configuration name in this process, and print its results as a json line."""
+    import ruclogin.ruclogin as rl
+    from mock_ruc import MockRUC
+    from ruclogin import metrics
+
+    engine, domains, cold, loginer_kwargs, mock_kwargs = CONFIGS[name]
+    with MockRUC(**mock_kwargs) as mock, tempfile.TemporaryDirectory() as tmp:
+        mock.patch(rl)
+        rl.ROOT = tmp
+        tic = timer()
+        if engine == "selenium":
+            rl.loginer_instance = rl.RUC_LOGIN(**loginer_kwargs)
+
+        def login():
+            if cold:
+                rl.clear_cookies(USERNAME)  # nothing to remember
+                if engine == "selenium":
+                    rl.loginer_instance.driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+                all_cookies = rl.get_all_cookies(
+                    domains, cache=False, username=USERNAME, password=PASSWORD, engine=engine
+                )
+            else:  # log in again, but reuse the session remembered by the last login
+                all_cookies = rl.regain_all_cookies(domains, USERNAME, PASSWORD, engine)
+            for domain, cookies in all_cookies.items():
+                assert rl.check_cookies(cookies, domain), (domain, cookies)
+
+        login()
+        startup = timer() - tic
+        latencies, submits, ocr_calls = [], [], []
+        for _ in range(n):
+            metrics.reset()
+            tic = timer()
+            login()
+            latencies.append(timer() - tic)
+            snapshot = metrics.snapshot()
+            submits.append(sum(c["value"] for c in snapshot["counters"] if c["name"] == "login_attempt"))
+            ocr_calls.append(sum(p["count"] for p in snapshot["phases"] if p["name"] == "ocr"))
+        rl.close_loginers()
+    print(
+        json.dumps(
+            {
+                "config": name,
+                "n": n,
+                "startup": startup,
+                "p50": percentile(latencies, 0.5),
+                "p95": percentile(latencies, 0.95),
+                "submits": statistics.mean(submits),
+                "ocr_calls": statistics.mean(ocr_calls),
+                "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                # the browser and its driver, once they have exited
+                "children_rss_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+            }
+        )
+    )
+
+
+def run(name, n):
+    """Results of configuration name from a fresh process, or None if it failed."""
+    process = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--worker", name, "-n", str(n)],
+        capture_output=True,
+        text=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    if process.returncode:
+        reason = (process.stderr.strip().splitlines() or ["exit status %d" % process.returncode])[-1]
+        print(f"{name:<22} skipped: {reason}")
+        return None
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+def regressions(results, baseline, tolerance):
+    found = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        for key in ["p50", "p95", "submits", "ocr_calls"]:
+            if result[key] > before[key] * (1 + tolerance) and result[key] - before[key] > 1e-3:
+                found.append(f"{name} {key}: {before[key]:.3f} -> {result[key]:.3f}")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", type=int, default=10, help="timed logins per configuration")
+    parser.add_argument("--configs", nargs="+", choices=list(CONFIGS), default=list(CONFIGS))
+    parser.add_argument("--json", help="save the results to this file")
+    parser.add_argument("--baseline", help="results saved by --json to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--worker", choices=list(CONFIGS), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        worker(args.worker, args.n)
+        return
+
+    print(
+        "{:<22} {:>8} {:>7} {:>7} {:>8} {:>6} {:>8} {:>9}".format(
+            "config", "startup", "p50", "p95", "submits", "ocr", "rss MB", "child MB"
+        )
+    )
+    results = {}
+    for name in args.configs:
+        result = run(name, args.n)
+        if result is None:
+            continue
+        results[name] = result
+        print(
+            "{config:<22} {startup:7.3f}s {p50:6.3f}s {p95:6.3f}s {submits:8.2f} {ocr_calls:6.2f} "
+            "{rss_mb:8.1f} {children_rss_mb:9.1f}".format(**result)
+        )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=1)
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(results, json.load(f), args.tolerance)
+        for line in found:
+            print("regression:", line)
+        if found:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
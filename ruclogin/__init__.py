@@ -1,9 +1,17 @@
 from .ruclogin import (
     RUC_LOGIN,
+    RUC_HTTP_LOGIN,
     get_cookies,
+    get_all_cookies,
     check_cookies,
+    check_cookies_many,
+    get_session,
+    clear_cookies,
     update_username_and_password,
     get_username_and_password,
     semester2code,
     code2semester,
 )
+from .pool import CookiePool, LoginerPool
+from .aio import aget_cookies, acheck_cookies
+from . import metrics
@@ -0,0 +1,149 @@
+"""
+asyncio versions of get_cookies and check_cookies.
+
+Cookies are checked with a pooled httpx.AsyncClient (pip install ruclogin[async]),
+or with check_cookies in a worker thread if httpx is not installed.
+Logins always run in a worker thread, and concurrent awaiters of the same
+(username, domain) share one login.
+"""
+
+import asyncio
+import weakref
+from functools import partial
+
+from . import metrics
+from .ruclogin import (
+    INI_PATH,
+    cache_state,
+    check_cookies,
+    check_request,
+    check_response,
+    config,
+    http_settings,
+    cookies_path,
+    load_cache,
+    mark_validated,
+    regain_cookies,
+)
+
+clients = weakref.WeakKeyDictionary()  # event loop -> httpx.AsyncClient
+inflight = weakref.WeakKeyDictionary()  # event loop -> {(username, domain): Future}
+
+
+def get_client():
+    """The httpx.AsyncClient of the running event loop, created on first use. None if httpx is not installed.
+    Its timeouts, connection retries and pool size are those of get_session, from config.ini."""
+    try:
+        import httpx
+    except ImportError:
+        return None
+    loop = asyncio.get_running_loop()
+    client = clients.get(loop)
+    if client is None or client.is_closed:
+        settings = http_settings()
+        connect, read = settings["timeout"]
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(read, connect=connect),
+            transport=httpx.AsyncHTTPTransport(
+                retries=settings["retries"],
+                limits=httpx.Limits(max_keepalive_connections=settings["pool_size"]),
+            ),
+        )
+        clients[loop] = client
+    return client
+
+
+async def aclose():
+    """Close the httpx.AsyncClient of the running event loop."""
+    client = clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+async def acheck_cookies(cookies, domain="v", detail=False):
+    """Coroutine version of check_cookies."""
+    client = get_client()
+    if client is None:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None, partial(check_cookies, cookies, domain, detail)
+        )
+    try:
+        method, url, kwargs = check_request(cookies, domain, detail)
+        # httpx deprecates per-request cookies, send them as a header instead
+        cookie_header = "; ".join(f"{k}={v}" for k, v in kwargs.pop("cookies").items())
+        kwargs["headers"] = {**kwargs["headers"], "Cookie": cookie_header}
+        with metrics.timed("validation", domain=domain.split(".")[0]):
+            response = await client.request(method, url, **kwargs)
+        return check_response(response.json(), domain, detail)
+    except Exception:
+        return None
+
+
+async def aget_cookies(
+    cache=True,
+    domain="v",
+    retry=3,
+    username="",
+    password="",
+    engine=None,
+    fresh=None,
+    ttl=None,
+    loginer_pool=None,
+    broker=None,
+) -> dict:
+    """Coroutine version of get_cookies, takes the same arguments.
+    The cookie broker is asked in a worker thread."""
+    domain = domain.split(".")[0]
+    if broker is None:
+        config.read(INI_PATH, encoding="utf-8")
+        broker = config.getboolean("broker", "client", fallback=False)
+    if broker:
+        from .broker import ask_broker
+
+        cookies = await asyncio.get_running_loop().run_in_executor(
+            None, partial(ask_broker, domain, username, password, refresh=not cache)
+        )
+        if cookies is not None:
+            return cookies
+    cache_path = cookies_path(domain, username)
+    if cache:
+        record = load_cache(cache_path)
+        state = cache_state(record, fresh, ttl)
+        if state == "fresh":
+            metrics.count("cache_hit", domain=domain)
+            return record["cookies"]
+        if state == "stale" and await acheck_cookies(record["cookies"], domain):
+            # it waits for the lock of the entry, while a login may hold it
+            record = await asyncio.get_running_loop().run_in_executor(
+                None, mark_validated, cache_path, record
+            )
+            metrics.count("cache_hit", domain=domain)
+            return record["cookies"]
+        metrics.count("cache_miss", domain=domain)
+    loop = asyncio.get_running_loop()
+    if not username:
+        config.read(INI_PATH, encoding="utf-8")
+        username = config.get("base", "username", raw=True)
+    futures = inflight.setdefault(loop, {})
+    key = (username, domain)
+    future = futures.get(key)
+    if future is None:
+        future = loop.run_in_executor(
+            None,
+            partial(
+                regain_cookies,
+                cache_path,
+                domain,
+                username,
+                password,
+                engine,
+                retry,
+                cache,
+                loginer_pool,
+            ),
+        )
+        futures[key] = future
+        future.add_done_callback(lambda _: futures.pop(key, None))
+    # shield: one awaiter being cancelled must not cancel the login the others wait for
+    return await asyncio.shield(future)
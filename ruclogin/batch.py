@@ -0,0 +1,171 @@
+"""
+Log many accounts in at once, without touching config.ini.
+
+    ruclogin batch --accounts accounts.csv --parallel 4 --domains v,jw --out cookies.jsonl
+
+accounts.csv has a username and a password per line, an optional first line
+"username,password" is skipped. Every account is logged in once for all its
+domains, with parallel loginers of the engine, and its result is written as
+a json line as soon as it is ready:
+
+    {"username": "2021201212", "ok": true, "cookies": {"v": {...}, "jw": {...}}, "latency": 1.2, "error": null}
+
+A summary of throughput and latency is printed to stderr at the end.
+"""
+
+import argparse
+import csv
+import json
+import os
+import statistics
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from timeit import default_timer as timer
+
+from . import metrics
+from .pool import LoginerPool
+from .ruclogin import INI_PATH, config, get_all_cookies
+
+
+def read_accounts(path):
+    """[(username, password)] in a csv file, "-" for stdin."""
+    f = sys.stdin if path == "-" else open(path, newline="", encoding="utf-8-sig")
+    try:
+        accounts = []
+        for row in csv.reader(f):
+            row = [cell.strip() for cell in row]
+            if not row or not row[0] or row[0].startswith("#"):
+                continue
+            if not accounts and row[0].lower() == "username":
+                continue
+            # an empty password would make the loginers fall back to the one in config.ini
+            if len(row) < 2 or not row[1]:
+                raise ValueError(f"no password for {row[0]} in {path}")
+            accounts.append((row[0], row[1]))
+        return accounts
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def open_out(path):
+    """The file to stream results to, "-" for stdout. Only the owner can read it, it holds cookies."""
+    if path == "-":
+        return sys.stdout
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    return open(fd, "w", encoding="utf-8")
+
+
+def login_account(username, password, domains, engine, cache, retry, loginer_pool, source):
+    tic = timer()
+    try:
+        cookies = get_all_cookies(
+            domains,
+            cache=cache,
+            retry=retry,
+            username=username,
+            password=password,
+            engine=engine,
+            loginer_pool=loginer_pool,
+            broker=False,
+        )
+        error = None
+    except ValueError as e:  # rejected by the server, its message points to config.ini
+        reason = str(e).splitlines()[0].rstrip("：:")
+        cookies, error = None, f"ValueError: {reason}, username {username}, password from {source}"
+    except Exception as e:
+        cookies, error = None, f"{type(e).__name__}: {e}"
+    return {
+        "username": username,
+        "ok": error is None,
+        "cookies": cookies,
+        "latency": timer() - tic,
+        "error": error,
+    }
+
+
+def summary(results, elapsed, submits):
+    latencies = sorted(result["latency"] for result in results)
+    ok = sum(result["ok"] for result in results)
+    lines = [
+        "{} accounts, {} ok, {} failed in {:.1f}s, {:.1f} accounts/min".format(
+            len(results), ok, len(results) - ok, elapsed, len(results) / elapsed * 60 if elapsed else 0
+        )
+    ]
+    if latencies:
+        lines.append(
+            "latency: p50 {:.2f}s, p95 {:.2f}s, max {:.2f}s, {:.2f} submits per account".format(
+                statistics.median(latencies),
+                latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))],
+                latencies[-1],
+                submits / len(latencies),
+            )
+        )
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="ruclogin batch",
+        description="Log many accounts in at once, and stream their cookies as json lines.",
+    )
+    parser.add_argument("--accounts", required=True, help='csv of "username,password" lines, - for stdin')
+    parser.add_argument("--parallel", type=int, default=2, help="loginers (browsers) running at the same time")
+    parser.add_argument("--domains", default="v,jw", help="comma separated, logged in once per account")
+    parser.add_argument("--out", default="-", help="json lines file, - for stdout")
+    parser.add_argument("--engine", choices=["selenium", "http"])
+    parser.add_argument("--no_cache", action="store_true", help="log in even if the cache has valid cookies")
+    parser.add_argument("--retry", type=int, default=3)
+    args = parser.parse_args(argv)
+    accounts = read_accounts(args.accounts)
+    if not accounts:
+        parser.error(f"no accounts in {args.accounts}")
+    domains = [domain.strip() for domain in args.domains.split(",") if domain.strip()]
+    engine = args.engine
+    if engine is None:
+        config.read(INI_PATH, encoding="utf-8")
+        engine = config["base"].get("engine", "selenium")
+    parallel = max(1, min(args.parallel, len(accounts)))
+
+    submits = [0]
+
+    def count_submits(kind, name, value, labels):
+        if name == "login_attempt":
+            submits[0] += value
+
+    metrics.add_callback(count_submits)
+    results = []
+    tic = timer()
+    out = open_out(args.out)
+    try:
+        # loginers start on the first cache miss, a run served by the cache starts no browser
+        with LoginerPool(parallel, engine, lazy=True) as loginer_pool, ThreadPoolExecutor(parallel) as executor:
+            futures = [
+                executor.submit(
+                    login_account,
+                    username,
+                    password,
+                    domains,
+                    engine,
+                    not args.no_cache,
+                    args.retry,
+                    loginer_pool,
+                    "stdin" if args.accounts == "-" else args.accounts,
+                )
+                for username, password in accounts
+            ]
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                out.flush()
+    finally:
+        metrics.remove_callback(count_submits)
+        if out is not sys.stdout:
+            out.close()
+    print(summary(results, timer() - tic, submits[0]), file=sys.stderr)
+    return 0 if all(result["ok"] for result in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,296 @@
+"""
+A local daemon holding the cookies of every account asked for in memory,
+and logging them in again before they expire, so that the processes asking
+it never start a browser or load the OCR model themselves.
+
+    ruclogin serve --domains v jw           # listens on address in the [broker] section of config.ini
+
+With client = true in the [broker] section, or get_cookies(broker=True),
+get_cookies asks the broker first, and only logs in itself if no broker is
+running. The broker listens on a Unix socket in the cache directory by
+default, on 127.0.0.1:6012 on Windows, and only answers clients with the
+same authkey: authkey in the [broker] section, else a random key kept in
+the cache directory. Any other host needs an explicit authkey.
+"""
+
+import argparse
+import os
+import os.path as osp
+import sys
+import threading
+from multiprocessing.connection import Client, Listener
+
+from . import metrics
+from .pool import CookiePool, LoginerPool
+from .ruclogin import INI_PATH, cache_dir, config, local_authkey, logger
+
+
+def broker_address(text=None):
+    """Parse a socket path or host:port, by default address in the [broker] section of config.ini."""
+    if text is None:
+        config.read(INI_PATH, encoding="utf-8")
+        text = config.get("broker", "address", fallback="")
+    if not text:
+        if sys.platform == "win32":
+            return ("127.0.0.1", 6012)
+        return osp.join(cache_dir(), "broker.sock")
+    host, sep, port = text.rpartition(":")
+    if sep and port.isdigit():
+        return host, int(port)
+    return text
+
+
+def broker_authkey(address=None):
+    """authkey in the [broker] section of config.ini, else the key generated for this user, see local_authkey.
+
+    Raises:
+        ValueError: if address is (host, port) with host not a loopback address, and no authkey is set.
+    """
+    host = address[0] if isinstance(address, tuple) else None
+    return local_authkey("broker", host)
+
+
+class CookieBroker:
+    """
+    Serve the cookies of a CookiePool to other processes on a local address.
+    An account is added to the pool the first time a client asks for it, and
+    removed if the server rejects its username or password, each client
+    connection is handled in its own thread.
+    """
+
+    def __init__(
+        self,
+        address=None,
+        authkey=None,
+        domains=(),
+        engine=None,
+        loginer_pool=None,
+        refresh_before=600,
+        interval=10,
+        timeout=None,
+    ) -> None:
+        """
+        Args:
+            address (str or tuple, optional): Socket path or (host, port). Defaults to broker_address().
+            authkey (bytes, optional): Defaults to broker_authkey(address).
+            domains (list, optional): Domains to log the account in config.ini in for at once. Defaults to ().
+            engine (str, optional): Passed to get_cookies.
+            loginer_pool (LoginerPool, optional): Log accounts in loginer_pool.size at a time with it.
+            refresh_before (float, optional): Seconds before the ttl in config.ini to log in again. Defaults to 600.
+            interval (float, optional): Seconds between two scans for expiring cookies. Defaults to 10.
+            timeout (float, optional): Seconds a client waits for the first login of an account.
+                Defaults to timeout in the [broker] section of config.ini.
+        """
+        address = address or broker_address()
+        authkey = authkey or broker_authkey(address)
+        if timeout is None:
+            config.read(INI_PATH, encoding="utf-8")
+            timeout = config.getfloat("broker", "timeout", fallback=60)
+        self.timeout = timeout
+        if isinstance(address, str) and osp.exists(address):
+            try:
+                Client(address, authkey=authkey).close()
+            except OSError:
+                os.unlink(address)  # left over by a broker that did not shut down
+            else:
+                raise RuntimeError(f"A cookie broker is already listening on {address}")
+        self.listener = Listener(address, authkey=authkey)
+        self.address = self.listener.address
+        self.pool = CookiePool(
+            [], (), refresh_before, interval, engine, loginer_pool
+        )
+        if domains:
+            config.read(INI_PATH, encoding="utf-8")
+            username = config.get("base", "username", raw=True)
+            password = config.get("base", "password", raw=True)
+            for domain in domains:
+                self.pool.add(username, password, domain)
+
+    def get(self, domain="v", username="", password="", refresh=False):
+        domain = domain.split(".")[0]
+        if not username:
+            config.read(INI_PATH, encoding="utf-8")
+            username = config.get("base", "username", raw=True)
+        self.pool.add(username, password, domain)
+        if refresh:
+            self.pool.invalidate(username, domain)
+        try:
+            return self.pool.get(domain, username, self.timeout)[1]
+        except ValueError:
+            # wrong username or password: forget the account, only another request logs it in again
+            self.pool.remove(username)
+            raise
+
+    def stats(self):
+        with self.pool.cond:
+            cookies = sum(record is not None for record in self.pool.entries.values())
+        return {
+            "accounts": len(self.pool.accounts),
+            "domains": list(self.pool.domains),
+            "cookies": cookies,
+            "metrics": metrics.snapshot(),
+        }
+
+    def handle(self, conn):
+        with conn:
+            while True:
+                try:
+                    command, options = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    if command == "get":
+                        result = self.get(**options)
+                    elif command == "invalidate":
+                        result = self.pool.invalidate(**options)
+                    elif command == "stats":
+                        result = self.stats()
+                    else:
+                        raise ValueError(f"unknown command {command}")
+                    conn.send(("ok", result))
+                except Exception as e:
+                    conn.send(("error", repr(e)))
+
+    def serve_forever(self):
+        while True:
+            try:
+                conn = self.listener.accept()
+            except OSError:  # closed
+                return
+            except Exception as e:  # e.g. a client with the wrong authkey
+                logger.info(f"Cookie broker refused a connection: {e}")
+                continue
+            threading.Thread(target=self.handle, args=(conn,), daemon=True).start()
+
+    def close(self):
+        self.listener.close()
+        self.pool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class BrokerClient:
+    """
+    Client of a CookieBroker. A connection is opened per thread and kept.
+    """
+
+    def __init__(self, address=None, authkey=None) -> None:
+        self.address = address or broker_address()
+        self.authkey = authkey or broker_authkey()
+        self.local = threading.local()
+
+    def request(self, message):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = self.local.conn = Client(self.address, authkey=self.authkey)
+        try:
+            conn.send(message)
+            status, result = conn.recv()
+        except (EOFError, OSError):
+            self.local.conn = None
+            raise
+        if status == "error":
+            raise RuntimeError(f"Cookie broker failed: {result}")
+        return result
+
+    def get(self, domain="v", username="", password="", refresh=False):
+        """Cookies of username, the broker logs in first if it has none, or if refresh."""
+        return self.request(
+            (
+                "get",
+                {"domain": domain, "username": username, "password": password, "refresh": refresh},
+            )
+        )
+
+    def invalidate(self, username, domain="v"):
+        """Drop the cookies of username, the broker regains them in the background."""
+        self.request(("invalidate", {"username": username, "domain": domain}))
+
+    def stats(self):
+        return self.request(("stats", {}))
+
+
+clients = {}  # address -> BrokerClient
+clients_lock = threading.Lock()
+
+
+def get_client():
+    """The BrokerClient of this process for the address in config.ini."""
+    address, authkey = broker_address(), broker_authkey()
+    with clients_lock:
+        client = clients.get((address, authkey))
+        if client is None:
+            client = clients[(address, authkey)] = BrokerClient(address, authkey)
+    return client
+
+
+def ask_broker(domain="v", username="", password="", refresh=False):
+    """Cookies from the broker, None if no broker is running.
+
+    Raises:
+        RuntimeError: if the broker is running but could not get the cookies.
+    """
+    client = get_client()
+    try:
+        cookies = client.get(domain, username, password, refresh)
+    except (EOFError, OSError) as e:
+        logger.info(f"No cookie broker on {client.address}: {e}")
+        return None
+    metrics.count("broker_hit", domain=domain.split(".")[0])
+    return cookies
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="ruclogin serve",
+        description="Hold cookies in memory for local processes, and log in again before they expire.",
+    )
+    parser.add_argument(
+        "--address", help="socket path or host:port, defaults to address in the [broker] section of config.ini"
+    )
+    parser.add_argument(
+        "--domains", nargs="*", default=["v", "jw"], help="log the account in config.ini in for them at once"
+    )
+    parser.add_argument("--engine", choices=["selenium", "http"])
+    parser.add_argument(
+        "--loginers", type=int, default=0, help="log in with a LoginerPool of this size, 0 for the module-wide loginer"
+    )
+    parser.add_argument("--refresh_before", type=float, default=600)
+    parser.add_argument("--interval", type=float, default=10)
+    args = parser.parse_args(argv)
+    address = broker_address(args.address)
+    try:
+        authkey = broker_authkey(address)
+    except ValueError as e:
+        parser.error(str(e))
+    loginer_pool = None
+    if args.loginers:
+        config.read(INI_PATH, encoding="utf-8")
+        engine = args.engine or config["base"].get("engine", "selenium")
+        loginer_pool = LoginerPool(args.loginers, engine)
+    broker = CookieBroker(
+        address,
+        authkey,
+        domains=args.domains,
+        engine=args.engine,
+        loginer_pool=loginer_pool,
+        refresh_before=args.refresh_before,
+        interval=args.interval,
+    )
+    logger.warning(f"Cookie broker listening on {broker.address}")
+    try:
+        broker.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        broker.close()
+        if loginer_pool:
+            loginer_pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Timings and counters of logins and cookie checks.
+
+Every phase of a login is timed (see PHASES) and every event is counted
+(see COUNTERS) into module-wide totals, which export as JSON or as
+Prometheus text, and are handed to the callbacks added with add_callback
+as they happen:
+
+    from ruclogin import metrics
+
+    metrics.add_callback(lambda kind, name, value, labels: print(kind, name, value, labels))
+    cookies = get_cookies(domain="jw")
+    print(metrics.to_prometheus())
+
+Recording is a dict update under a lock, cheap enough to be always on.
+"""
+
+import json
+import logging
+import threading
+from contextlib import contextmanager
+from timeit import default_timer as timer
+
+PHASES = {
+    "driver_init": "Start the browser and its driver",
+    "page_load": "Load the login page, up to the form or the redirect of a remembered session",
+    "element_lookup": "Find the elements of the login form",
+    "captcha_wait": "Wait for, or fetch, a new code image",
+    "ocr": "Recognize a code image, memo hits excluded",
+    "submit": "Submit the form until its result shows",
+    "cookie_extraction": "Read the cookies of a domain after login, following the jw redirect",
+    "validation": "Check cookies against the server",
+}
+COUNTERS = {
+    "captcha_refresh": "Code images after the first of a login",
+    "ocr_reject": "Recognized codes not confident enough to submit",
+    "memo_hit": "Code images answered by the captcha memo",
+    "login_attempt": "Forms submitted",
+    "wrong_code": "Forms submitted with a wrong code",
+    "remembered_session": "Logins skipped because the remembered session was still valid",
+    "cache_hit": "Cookies served from the cache",
+    "cache_miss": "Cookies regained because the cache missed",
+    "broker_hit": "Cookies served by the cookie broker",
+}
+
+logger = logging.getLogger(__name__)
+lock = threading.Lock()
+phases = {}  # (name, labels) -> [count, sum, max]
+counters = {}  # (name, labels) -> value
+callbacks = []
+
+
+def add_callback(callback):
+    """Call callback(kind, name, value, labels) on every record,
+    kind is "phase" with value in seconds, or "counter" with value the increment.
+    It runs in the thread that records, exceptions are logged and dropped."""
+    with lock:
+        callbacks.append(callback)
+
+
+def remove_callback(callback):
+    with lock:
+        if callback in callbacks:
+            callbacks.remove(callback)
+
+
+def notify(kind, name, value, labels):
+    for callback in list(callbacks):
+        try:
+            callback(kind, name, value, labels)
+        except Exception as e:
+            logger.warning(f"metrics callback {callback!r} failed: {e}")
+
+
+def observe(name, seconds, **labels):
+    """Record that phase name took seconds."""
+    key = (name, tuple(sorted(labels.items())))
+    with lock:
+        stat = phases.setdefault(key, [0, 0.0, 0.0])
+        stat[0] += 1
+        stat[1] += seconds
+        stat[2] = max(stat[2], seconds)
+    notify("phase", name, seconds, labels)
+
+
+@contextmanager
+def timed(name, **labels):
+    """Time the body as phase name, also when it raises."""
+    tic = timer()
+    try:
+        yield
+    finally:
+        observe(name, timer() - tic, **labels)
+
+
+def count(name, value=1, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    with lock:
+        counters[key] = counters.get(key, 0) + value
+    notify("counter", name, value, labels)
+
+
+def reset():
+    with lock:
+        phases.clear()
+        counters.clear()
+
+
+def snapshot():
+    """The totals so far, as {"phases": [...], "counters": [...]}."""
+    with lock:
+        return {
+            "phases": [
+                {"name": name, "labels": dict(labels), "count": n, "sum": total, "max": top}
+                for (name, labels), (n, total, top) in sorted(phases.items())
+            ],
+            "counters": [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(counters.items())
+            ],
+        }
+
+
+def to_json(**kwargs):
+    return json.dumps(snapshot(), **kwargs)
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (key, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for key, value in labels
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+def to_prometheus(prefix="ruclogin"):
+    """The totals in the Prometheus text exposition format:
+    a summary {prefix}_phase_seconds and a gauge {prefix}_phase_seconds_max labeled by phase,
+    and a {prefix}_{name}_total counter for every counter."""
+    with lock:
+        phase_items = sorted(phases.items())
+        counter_items = sorted(counters.items())
+    lines = []
+    if phase_items:
+        lines += [
+            f"# HELP {prefix}_phase_seconds Time spent in each phase of a login",
+            f"# TYPE {prefix}_phase_seconds summary",
+        ]
+        for (name, labels), (n, total, _) in phase_items:
+            tags = format_labels((("phase", name),) + labels)
+            lines.append(f"{prefix}_phase_seconds_count{tags} {n}")
+            lines.append(f"{prefix}_phase_seconds_sum{tags} {total:.6f}")
+        lines += [
+            f"# HELP {prefix}_phase_seconds_max Longest time spent in each phase of a login",
+            f"# TYPE {prefix}_phase_seconds_max gauge",
+        ]
+        for (name, labels), (_, _, top) in phase_items:
+            tags = format_labels((("phase", name),) + labels)
+            lines.append(f"{prefix}_phase_seconds_max{tags} {top:.6f}")
+    last = None
+    for (name, labels), value in counter_items:
+        if name != last:
+            lines += [
+                f"# HELP {prefix}_{name}_total {COUNTERS.get(name, name)}",
+                f"# TYPE {prefix}_{name}_total counter",
+            ]
+            last = name
+        lines.append(f"{prefix}_{name}_total{format_labels(labels)} {value}")
+    return "\n".join(lines) + "\n" if lines else ""
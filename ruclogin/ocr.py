@@ -0,0 +1,449 @@
+"""
+Code recognition shared by every loginer of a process, or of a host.
+
+get_ocr returns the process-wide SharedOCR, so the ddddocr model and its
+onnxruntime session are loaded once per process instead of once per loginer.
+With server set in the [ocr] section of config.ini, it returns a RemoteOCR
+instead, which sends the images to an OCRServer, so the model is loaded once
+per host:
+
+    python -m ruclogin.ocr --port 6011
+
+Only clients with the same authkey are answered: authkey in the [ocr] section,
+else a random key kept in the cache directory (see local_authkey), which is
+enough for processes of the same user on the same host.
+"""
+
+import argparse
+import hashlib
+import os.path as osp
+import pickle
+import string
+import threading
+from collections import OrderedDict
+from multiprocessing.connection import Client, Listener
+
+from . import metrics
+from .ruclogin import (
+    INI_PATH,
+    FileLock,
+    cache_dir,
+    config,
+    local_authkey,
+    logger,
+    save_cache,
+)
+
+CODE_CHARSET = string.ascii_letters
+CODE_LENGTH = 4
+MIN_CONFIDENCE = 0.1  # below it, refreshing the image is cheaper than a wrong submit
+
+shared_ocr = None
+shared_memo = None
+shared_ocr_lock = threading.Lock()
+
+
+def decode_code(
+    result,
+    charset=CODE_CHARSET,
+    length=CODE_LENGTH,
+    ignore_case=False,
+    exclude=(),
+    beam=16,
+):
+    """
+    The most likely code of exactly length characters from charset,
+    given the probability output of ddddocr classification.
+
+    The per-step probabilities are restricted to charset and the CTC blank,
+    and a prefix beam search sums the paths of each code, so the confidence
+    is the probability of the whole code rather than of its best path.
+    With ignore_case, both cases of a letter count as one lowercase symbol.
+    Codes in exclude, e.g. answers the server rejected, are never returned.
+
+    Returns:
+        (str, float): (code, confidence), ("", 0.0) if no code fits.
+    """
+    import numpy as np
+
+    # ddddocr 1.6 returns charset/probabilities, 1.5 charsets/probability
+    full_charset = result.get("charset") or result.get("charsets")
+    probs = result.get("probabilities")
+    if probs is None:
+        probs = result.get("probability")
+    probs = np.asarray(probs, dtype=np.float64).reshape(-1, len(full_charset))
+    index = {c: i for i, c in enumerate(full_charset)}
+    symbols = [""]
+    columns = [[index[""]]]
+    for c in charset:
+        if c not in index:
+            continue
+        if ignore_case and c.lower() in symbols:
+            columns[symbols.index(c.lower())].append(index[c])
+        else:
+            symbols.append(c.lower() if ignore_case else c)
+            columns.append([index[c]])
+    symbols = symbols[1:]
+    probs = np.stack([probs[:, cols].sum(axis=1) for cols in columns], axis=1)
+    probs /= probs.sum(axis=1, keepdims=True)
+
+    # prefix -> (P(paths ending in blank), P(paths ending in its last symbol))
+    beams = {(): (1.0, 0.0)}
+    for step in probs:
+        blank = step[0]
+        candidates = {}
+        for prefix, (p_b, p_nb) in beams.items():
+            b, nb = candidates.get(prefix, (0.0, 0.0))
+            b += (p_b + p_nb) * blank
+            if prefix:
+                nb += p_nb * step[prefix[-1] + 1]  # repeated symbol collapses
+            candidates[prefix] = (b, nb)
+            if len(prefix) == length:
+                continue
+            for k in np.argsort(step[1:])[-beam:]:
+                extended = prefix + (k,)
+                b, nb = candidates.get(extended, (0.0, 0.0))
+                if prefix and prefix[-1] == k:
+                    nb += p_b * step[k + 1]  # a repeat needs a blank in between
+                else:
+                    nb += (p_b + p_nb) * step[k + 1]
+                candidates[extended] = (b, nb)
+        beams = dict(
+            sorted(candidates.items(), key=lambda item: -sum(item[1]))[:beam]
+        )
+    codes = [
+        (sum(p), code)
+        for code, p in (("".join(symbols[k] for k in prefix), p) for prefix, p in beams.items())
+        if len(code) == length and code not in exclude
+    ]
+    if not codes:
+        return "", 0.0
+    confidence, code = max(codes)
+    return code, float(confidence)
+
+
+def find_session(ocr):
+    """The onnxruntime session inside a ddddocr.DdddOcr, for ddddocr 1.5 and 1.6."""
+    engine = getattr(ocr, "ocr_engine", None)
+    if engine is not None:
+        return engine, "session"
+    return ocr, "_DdddOcr__ort_session"
+
+
+class SharedOCR:
+    """
+    One ddddocr model that many threads can call at the same time,
+    onnxruntime sessions are safe to run concurrently.
+    """
+
+    def __init__(
+        self,
+        intra_op_threads=0,
+        inter_op_threads=0,
+        min_confidence=MIN_CONFIDENCE,
+        ignore_case=False,
+    ) -> None:
+        """
+        Args:
+            intra_op_threads (int, optional): Threads used inside one inference, 0 for the onnxruntime default.
+            inter_op_threads (int, optional): Threads used across the nodes of one inference, 0 for the onnxruntime default.
+            min_confidence (float, optional): Codes recognized with a lower confidence are not worth submitting.
+            ignore_case (bool, optional): Whether the server accepts codes in any case.
+        """
+        self.min_confidence = min_confidence
+        self.ignore_case = ignore_case
+        import ddddocr
+        import onnxruntime
+
+        onnxruntime.set_default_logger_severity(3)
+        self.ocr = ddddocr.DdddOcr(show_ad=False)
+        if intra_op_threads or inter_op_threads:
+            owner, name = find_session(self.ocr)
+            session = getattr(owner, name)
+            options = onnxruntime.SessionOptions()
+            options.intra_op_num_threads = intra_op_threads
+            options.inter_op_num_threads = inter_op_threads
+            setattr(
+                owner,
+                name,
+                onnxruntime.InferenceSession(
+                    session._model_path,
+                    sess_options=options,
+                    providers=session.get_providers(),
+                ),
+            )
+
+    def classification(self, img: bytes, probability=False):
+        return self.ocr.classification(img, probability=probability)
+
+    def classify_many(self, imgs):
+        return [self.classification(img) for img in imgs]
+
+    def recognize(self, img: bytes, exclude=()):
+        """(code, confidence) of a code image, see decode_code."""
+        return decode_code(
+            self.classification(img, probability=True),
+            ignore_case=self.ignore_case,
+            exclude=exclude,
+        )
+
+    def recognize_many(self, imgs, exclude=()):
+        return [self.recognize(img, exclude) for img in imgs]
+
+
+class RemoteOCR:
+    """
+    Client of an OCRServer, with the same classification interface as SharedOCR.
+    A connection is opened per thread and kept.
+    """
+
+    def __init__(
+        self, address, authkey=None, min_confidence=MIN_CONFIDENCE
+    ) -> None:
+        self.address = address
+        self.min_confidence = min_confidence
+        self.authkey = authkey or local_authkey("ocr")
+        self.local = threading.local()
+
+    def request(self, message):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = self.local.conn = Client(self.address, authkey=self.authkey)
+        try:
+            conn.send(message)
+            status, result = conn.recv()
+        except (EOFError, OSError):
+            self.local.conn = None
+            raise
+        if status == "error":
+            raise RuntimeError(f"OCR server failed: {result}")
+        return result
+
+    def classification(self, img: bytes, probability=False):
+        return self.request(("classify", [img], {"probability": probability}))[0]
+
+    def classify_many(self, imgs):
+        """Recognize a batch of images in one round trip."""
+        return self.request(("classify", list(imgs), {}))
+
+    def recognize(self, img: bytes, exclude=()):
+        return self.recognize_many([img], exclude)[0]
+
+    def recognize_many(self, imgs, exclude=()):
+        """Recognize a batch of code images in one round trip, see decode_code."""
+        results = self.request(("recognize", list(imgs), {"exclude": list(exclude)}))
+        return [tuple(result) for result in results]
+
+
+class OCRServer:
+    """
+    Serve a SharedOCR to other processes on a local address.
+    Each client connection is handled in its own thread, the model is shared.
+    Clients send pickles, so only clients with the authkey are answered, see local_authkey.
+    """
+
+    def __init__(self, address=("127.0.0.1", 6011), authkey=None, **kwargs):
+        authkey = authkey or local_authkey("ocr", address[0])
+        self.ocr = SharedOCR(**kwargs)
+        self.listener = Listener(address, authkey=authkey)
+        self.address = self.listener.address
+
+    def handle(self, conn):
+        with conn:
+            while True:
+                try:
+                    command, imgs, options = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    if command == "classify":
+                        result = [self.ocr.classification(img, **options) for img in imgs]
+                    elif command == "recognize":
+                        result = self.ocr.recognize_many(imgs, **options)
+                    else:
+                        raise ValueError(f"unknown command {command}")
+                    conn.send(("ok", result))
+                except Exception as e:
+                    conn.send(("error", repr(e)))
+
+    def serve_forever(self):
+        while True:
+            try:
+                conn = self.listener.accept()
+            except OSError:  # closed
+                return
+            except Exception as e:  # e.g. a client with the wrong authkey
+                logger.info(f"OCR server refused a connection: {e}")
+                continue
+            threading.Thread(target=self.handle, args=(conn,), daemon=True).start()
+
+    def close(self):
+        self.listener.close()
+
+
+class CodeMemo:
+    """
+    Answers to code images seen before, keyed by the sha1 of the image.
+
+    The answer that logged in is remembered with its image, so a repeated
+    image skips recognition, and doubles as labeled data for eval_ocr.py.
+    Answers the server rejected are remembered as bad and never resubmitted.
+    At most size images are kept, least recently used first out, in memory
+    and in path, which several processes can share.
+    """
+
+    def __init__(self, path=None, size=1000) -> None:
+        self.path = path
+        self.size = size
+        self.entries = OrderedDict()  # sha1 -> {"code": str or None, "bad": set, "img": bytes or None}
+        self.lookups = 0
+        self.hits = 0
+        self.lock = threading.Lock()
+        if path:
+            self.entries.update(self.load())
+
+    def load(self):
+        try:
+            with open(self.path, "rb") as f:
+                return pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return OrderedDict()
+
+    @staticmethod
+    def key(img: bytes):
+        return hashlib.sha1(img).hexdigest()
+
+    def recognize(self, ocr, img: bytes):
+        """(code, confidence) of img, from the memo if it logged in before, else from ocr without the bad answers."""
+        key = self.key(img)
+        with self.lock:
+            self.lookups += 1
+            entry = self.entries.get(key)
+            if entry:
+                self.entries.move_to_end(key)
+                if entry["code"]:
+                    self.hits += 1
+                    metrics.count("memo_hit")
+                    return entry["code"], 1.0
+        with metrics.timed("ocr"):
+            return ocr.recognize(img, exclude=entry["bad"] if entry else ())
+
+    def record(self, img: bytes, code, success):
+        """Remember whether the server accepted code for img."""
+        if not self.size:
+            return
+        key = self.key(img)
+        with self.lock:
+            entry = self.entries.pop(key, None) or {"code": None, "bad": set(), "img": None}
+            if success:
+                entry["code"], entry["img"] = code, img
+            else:
+                entry["bad"].add(code)
+            self.entries[key] = entry
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+        if success:
+            self.save()
+
+    def save(self):
+        """Merge the memo into path, once per successful login."""
+        if not self.path:
+            return
+        with FileLock(self.path + ".lock"):
+            entries = self.load()
+            with self.lock:
+                for key, entry in self.entries.items():
+                    entries.pop(key, None)
+                    entries[key] = entry
+            while len(entries) > self.size:
+                entries.popitem(last=False)
+            save_cache(self.path, entries)
+
+    @property
+    def hit_rate(self):
+        return self.hits / self.lookups if self.lookups else 0.0
+
+    def stats(self):
+        return {
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hit_rate": self.hit_rate,
+            "size": len(self.entries),
+        }
+
+    def labeled(self):
+        """[(code, img)] of the images whose answer logged in."""
+        with self.lock:
+            return [(e["code"], e["img"]) for e in self.entries.values() if e["code"]]
+
+
+def parse_address(text):
+    host, port = text.rsplit(":", 1)
+    return host, int(port)
+
+
+def get_ocr():
+    """The OCR of this process: a RemoteOCR if [ocr] server is set in config.ini, else the SharedOCR."""
+    global shared_ocr
+    config.read(INI_PATH, encoding="utf-8")
+    server = config.get("ocr", "server", fallback="")
+    min_confidence = config.getfloat("ocr", "min_confidence", fallback=MIN_CONFIDENCE)
+    if server:
+        return RemoteOCR(parse_address(server), local_authkey("ocr"), min_confidence)
+    with shared_ocr_lock:
+        if shared_ocr is None:
+            shared_ocr = SharedOCR(
+                intra_op_threads=config.getint("ocr", "intra_op_threads", fallback=0),
+                inter_op_threads=config.getint("ocr", "inter_op_threads", fallback=0),
+            )
+        shared_ocr.min_confidence = min_confidence
+        shared_ocr.ignore_case = config.getboolean("ocr", "ignore_case", fallback=False)
+    return shared_ocr
+
+
+def release_ocr():
+    """Drop the SharedOCR of this process, get_ocr loads it again."""
+    global shared_ocr
+    with shared_ocr_lock:
+        shared_ocr = None
+
+
+def get_memo():
+    """The CodeMemo of this process, in captcha_memo.pkl of the cache directory."""
+    global shared_memo
+    with shared_ocr_lock:
+        if shared_memo is None:
+            config.read(INI_PATH, encoding="utf-8")
+            shared_memo = CodeMemo(
+                osp.join(cache_dir(), "captcha_memo.pkl"),
+                config.getint("ocr", "memo_size", fallback=1000),
+            )
+    return shared_memo
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve code recognition to local processes.")
+    parser.add_argument(
+        "--host", default="127.0.0.1", help="other than loopback, needs authkey in the [ocr] section of config.ini"
+    )
+    parser.add_argument("--port", type=int, default=6011)
+    parser.add_argument("--intra_op_threads", type=int, default=0)
+    parser.add_argument("--inter_op_threads", type=int, default=0)
+    args = parser.parse_args()
+    try:
+        server = OCRServer(
+            (args.host, args.port),
+            intra_op_threads=args.intra_op_threads,
+            inter_op_threads=args.inter_op_threads,
+        )
+    except ValueError as e:
+        parser.error(str(e))
+    logger.warning(f"OCR server listening on {args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,387 @@
+import importlib.util
+import itertools
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from time import time
+
+from .ruclogin import (
+    INI_PATH,
+    RUC_HTTP_LOGIN,
+    RUC_LOGIN,
+    config,
+    cookies_path,
+    get_cookies,
+    load_cache,
+    logger,
+)
+
+
+class LoginerPool:
+    """
+    A fixed number of loginers leased to concurrent get_cookies calls.
+
+    Unlike the module-wide loginer instance, which serializes every login of
+    the process, each leased loginer logs in on its own, so size logins run
+    in parallel. A loginer is recycled (closed and replaced by a new one) when
+    it fails its health check, when a login with it raises, e.g. a crashed
+    browser or a TimeoutError, after max_uses logins, and when the browsers
+    of the pool use more than max_memory MB.
+
+    with LoginerPool(size=4) as pool:       # starts 4 headless browsers in parallel
+        cookies = get_cookies(domain="jw", username=..., password=..., loginer_pool=pool)
+    """
+
+    def __init__(
+        self, size=2, engine="selenium", debug=False, max_uses=100, max_memory=None, lazy=False
+    ) -> None:
+        """
+        Args:
+            size (int, optional): Number of loginers. Defaults to 2.
+            engine (str, optional): "selenium" or "http". Defaults to "selenium".
+            debug (bool, optional): Passed to RUC_LOGIN. Defaults to False.
+            max_uses (int, optional): Logins before a loginer is recycled. Defaults to 100.
+            max_memory (float, optional): MB the browsers may use in total, needs psutil (pip install ruclogin[memory]).
+                Defaults to None, no limit.
+            lazy (bool, optional): Start each loginer on its first lease instead of all at once,
+                so a pool that is never leased from starts no browser. Defaults to False.
+
+        Raises:
+            ImportError: if max_memory is set but psutil is not installed.
+        """
+        if engine not in ["selenium", "http"]:
+            raise ValueError("engine must be selenium or http")
+        if max_memory and importlib.util.find_spec("psutil") is None:
+            raise ImportError("max_memory needs psutil, pip install ruclogin[memory]")
+        self.size = size
+        self.engine = engine
+        self.debug = debug
+        self.max_uses = max_uses
+        self.max_memory = max_memory
+        self.uses = {}  # id(loginer) -> logins done
+        self.idle = queue.Queue()
+        self.loginers = []
+        self.lock = threading.Lock()
+        if lazy:
+            for _ in range(size):
+                self.idle.put(None)  # an empty slot, filled by its first lease
+            return
+        with ThreadPoolExecutor(size) as executor:
+            for loginer in executor.map(lambda _: self.create(), range(size)):
+                self.idle.put(loginer)
+
+    def create(self):
+        if self.engine == "http":
+            loginer = RUC_HTTP_LOGIN()
+        else:
+            loginer = RUC_LOGIN(debug=self.debug)
+        with self.lock:
+            self.loginers.append(loginer)
+            self.uses[id(loginer)] = 0
+        return loginer
+
+    def discard(self, loginer):
+        with self.lock:
+            self.loginers.remove(loginer)
+            self.uses.pop(id(loginer), None)
+        try:
+            loginer.close()
+        except Exception as e:
+            logger.info(f"Failed to close a loginer: {e}")
+
+    def recycle(self, loginer):
+        """Replace loginer (None for a slot whose loginer is already gone) with a new one."""
+        if loginer is not None:
+            self.discard(loginer)
+        return self.create()
+
+    def healthy(self, loginer):
+        if not hasattr(loginer, "driver"):
+            return isinstance(loginer, RUC_HTTP_LOGIN)
+        try:
+            loginer.driver.current_url
+            return True
+        except Exception:
+            return False
+
+    def memory(self):
+        """MB used by the browsers of the pool."""
+        import psutil
+
+        total = 0
+        with self.lock:
+            loginers = list(self.loginers)
+        for loginer in loginers:
+            try:
+                process = psutil.Process(loginer.driver.service.process.pid)
+                for p in [process, *process.children(recursive=True)]:
+                    total += p.memory_info().rss
+            except Exception:
+                continue
+        return total / 1024 / 1024
+
+    @contextmanager
+    def lease(self, timeout=None):
+        """Lease a healthy loginer, wait at most timeout seconds for one to be free."""
+        try:
+            loginer = self.idle.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError("No free loginer in the pool")
+        try:
+            if loginer is None:
+                loginer = self.create()
+            elif not self.healthy(loginer):
+                logger.info("Recycle an unhealthy loginer")
+                loginer = self.recycle(loginer)
+            try:
+                yield loginer
+            except ValueError:  # wrong username or password, the loginer is fine
+                raise
+            except Exception:
+                loginer = self.recycle(loginer)
+                raise
+            self.uses[id(loginer)] += 1
+            if self.uses[id(loginer)] >= self.max_uses:
+                loginer = self.recycle(loginer)
+            elif self.max_memory and self.engine == "selenium":
+                memory = self.memory()
+                if memory > self.max_memory:
+                    logger.info(f"Recycle a loginer, browsers use {memory:.0f}MB")
+                    loginer = self.recycle(loginer)
+        finally:
+            # if recycling failed, leave an empty slot for the next lease to fill
+            with self.lock:
+                alive = loginer in self.loginers
+            self.idle.put(loginer if alive else None)
+
+    def close(self):
+        with self.lock:
+            loginers = list(self.loginers)
+        for loginer in loginers:
+            self.discard(loginer)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CookiePool:
+    """
+    Hand out cookies of several accounts to many worker threads.
+
+    A background thread logs every (username, domain) in, and logs it in again
+    refresh_before seconds before its cache ttl runs out, so get only waits
+    when no account has been logged in yet. A wrong username or password is
+    never submitted again, get raises its ValueError instead, other failures
+    are retried after interval seconds, doubled after each failure up to
+    max_backoff seconds.
+
+    pool = CookiePool([("2021201212", "ABC12345"), ("2021201213", "ABC12346")], domains=["v", "jw"])
+    username, cookies = pool.get("jw")      # round robin over the accounts
+    pool.invalidate(username, "jw")         # if the server rejects the cookies
+    pool.close()
+    """
+
+    def __init__(
+        self,
+        accounts,
+        domains=("v",),
+        refresh_before=600,
+        interval=10,
+        engine=None,
+        loginer_pool=None,
+        max_backoff=600,
+    ) -> None:
+        """
+        Args:
+            accounts (list): [(username, password), ...]
+            domains (list, optional): Domains to keep cookies for. Defaults to ("v",).
+            refresh_before (float, optional): Seconds before the ttl in config.ini to log in again. Defaults to 600.
+            interval (float, optional): Seconds between two scans for expiring cookies. Defaults to 10.
+            engine (str, optional): Passed to get_cookies.
+            loginer_pool (LoginerPool, optional): Refresh loginer_pool.size entries at a time with it.
+            max_backoff (float, optional): Most seconds between two retries of a failed refresh. Defaults to 600.
+        """
+        self.accounts = dict(accounts)
+        self.domains = [domain.split(".")[0] for domain in domains]
+        self.refresh_before = refresh_before
+        self.interval = interval
+        self.engine = engine
+        self.loginer_pool = loginer_pool
+        self.max_backoff = max_backoff
+        config.read(INI_PATH, encoding="utf-8")
+        self.ttl = config.getfloat("cache", "ttl", fallback=86400)
+        self.entries = {}  # (username, domain) -> cache record
+        self.errors = {}  # (username, domain) -> why the last refresh failed
+        self.retries = {}  # (username, domain) -> (failures in a row, time of the next try)
+        self.rejected = {}  # (username, domain) -> ValueError of a wrong username or password
+        self.cycles = {domain: itertools.cycle(list(self.accounts)) for domain in self.domains}
+        self.cond = threading.Condition()
+        self.wake = threading.Event()
+        self.closed = threading.Event()
+        self.thread = threading.Thread(target=self.refresh_loop, daemon=True)
+        self.thread.start()
+
+    def pick(self, domain, username=None):
+        if username is not None:
+            record = self.entries.get((username, domain))
+            return (username, record["cookies"]) if record else None
+        for _ in range(len(self.accounts)):
+            username = next(self.cycles[domain])
+            record = self.entries.get((username, domain))
+            if record:
+                return username, record["cookies"]
+        return None
+
+    def rejection(self, domain, username=None):
+        """The ValueError of username, or of the last account if every account was rejected, else None."""
+        if username is not None:
+            return self.rejected.get((username, domain))
+        errors = [self.rejected.get((username, domain)) for username in self.accounts]
+        return errors[-1] if errors and all(errors) else None
+
+    def get(self, domain="v", username=None, timeout=None):
+        """Get cookies of an account, never logs in in the calling thread.
+
+        Args:
+            domain (str, optional): Defaults to "v".
+            username (str, optional): Take the next account with cookies if None. Defaults to None.
+            timeout (float, optional): Seconds to wait for the first login. Defaults to None, wait forever.
+
+        Returns:
+            (str, dict): (username, cookies)
+
+        Raises:
+            ValueError: if the username or password was rejected by the server.
+            TimeoutError: if there are no cookies after timeout seconds.
+        """
+        domain = domain.split(".")[0]
+        with self.cond:
+            picked = self.cond.wait_for(
+                lambda: self.pick(domain, username) or self.rejection(domain, username), timeout
+            )
+        if isinstance(picked, ValueError):
+            raise picked
+        if not picked:
+            error = self.errors.get((username, domain))
+            raise TimeoutError(
+                f"No cookies of {username or 'any account'} for {domain}"
+                + (f", the last login failed: {error}" if error else "")
+            )
+        return picked
+
+    def add(self, username, password="", domain="v"):
+        """Keep cookies of another account, or of another domain for every account, from now on."""
+        domain = domain.split(".")[0]
+        with self.cond:
+            known = username in self.accounts and domain in self.domains
+            if known and (not password or self.accounts[username] == password):
+                return
+            if password or username not in self.accounts:
+                self.accounts[username] = password
+                # a new password is worth a try
+                for key in [key for key in self.rejected if key[0] == username]:
+                    del self.rejected[key]
+                    self.retries.pop(key, None)
+            if domain not in self.domains:
+                self.domains.append(domain)
+            self.cycles = {d: itertools.cycle(list(self.accounts)) for d in self.domains}
+        self.wake.set()
+
+    def remove(self, username):
+        """Stop keeping cookies of username."""
+        with self.cond:
+            self.accounts.pop(username, None)
+            for table in [self.entries, self.errors, self.retries, self.rejected]:
+                for key in [key for key in table if key[0] == username]:
+                    del table[key]
+            self.cycles = {d: itertools.cycle(list(self.accounts)) for d in self.domains}
+
+    def invalidate(self, username, domain="v"):
+        """Drop the cookies of username, they will be regained in the background."""
+        with self.cond:
+            self.entries[(username, domain.split(".")[0])] = None
+        self.wake.set()
+
+    def due(self):
+        now = time()
+        # add may change them while the refresh thread scans
+        for username in list(self.accounts):
+            for domain in list(self.domains):
+                key = (username, domain)
+                if key in self.rejected or now < self.retries.get(key, (0, 0))[1]:
+                    continue
+                record = self.entries.get(key)
+                if not record or now - record["issued_at"] > self.ttl - self.refresh_before:
+                    yield key
+
+    def refresh(self, username, domain):
+        if self.closed.is_set():
+            return
+        # a missing entry may still be in the disk cache, an expiring or invalidated one has to be regained
+        key = (username, domain)
+        cache = key not in self.entries
+        password = self.accounts.get(username)
+        if password is None:  # removed while waiting for its turn
+            return
+        try:
+            cookies = get_cookies(
+                cache=cache,
+                domain=domain,
+                username=username,
+                password=password,
+                engine=self.engine,
+                loginer_pool=self.loginer_pool,
+                broker=False,
+            )
+        except Exception as e:
+            with self.cond:
+                if self.accounts.get(username) != password:
+                    return
+                self.errors[key] = e
+                if isinstance(e, ValueError):
+                    # wrong username or password, submitting it again only risks locking the account
+                    logger.warning(f"CookiePool stops refreshing {username} {domain}: {e}")
+                    self.rejected[key] = e
+                else:
+                    failures = self.retries.get(key, (0, 0))[0] + 1
+                    delay = min(self.interval * 2 ** (failures - 1), self.max_backoff)
+                    logger.warning(
+                        f"CookiePool failed to refresh {username} {domain}, retry in {delay:g}s: {e}"
+                    )
+                    self.retries[key] = (failures, time() + delay)
+                self.cond.notify_all()
+            return
+        record = load_cache(cookies_path(domain, username))
+        if not record or record["cookies"] != cookies:
+            record = {"cookies": cookies, "issued_at": time(), "validated_at": time()}
+        with self.cond:
+            if self.accounts.get(username) != password:
+                return
+            self.entries[key] = record
+            self.errors.pop(key, None)
+            self.retries.pop(key, None)
+            self.cond.notify_all()
+
+    def refresh_loop(self):
+        workers = self.loginer_pool.size if self.loginer_pool else 1
+        with ThreadPoolExecutor(workers) as executor:
+            while not self.closed.is_set():
+                for _ in executor.map(lambda key: self.refresh(*key), list(self.due())):
+                    pass
+                self.wake.wait(self.interval)
+                self.wake.clear()
+
+    def close(self):
+        self.closed.set()
+        self.wake.set()
+        self.thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,46 +1,73 @@
 # from selenium import webdriver
+from __future__ import annotations
+
 import base64
 import configparser
 import datetime
+import ipaddress
 import os
 import os.path as osp
 import pickle
+import re
+import secrets
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from contextlib import ExitStack, contextmanager
+from glob import glob
+from http.cookiejar import DefaultCookiePolicy
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
 from getpass import getpass
-from time import sleep
+from time import sleep, time
 from timeit import default_timer as timer
 import argparse
 import logging
+from typing import TYPE_CHECKING
+from urllib.parse import quote, urlparse
 
-import ddddocr
-import onnxruntime
 import requests
-import seleniumwire.webdriver as webdriver
 from requests.exceptions import ConnectionError
-from selenium.common.exceptions import (
-    ElementClickInterceptedException,
-    StaleElementReferenceException,
-)
-from selenium.webdriver.chrome.service import Service as ChromeService
-from selenium.webdriver.common.by import By
-from selenium.webdriver.edge.service import Service as EdgeService
-from selenium.webdriver.remote.webelement import WebElement
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.support.ui import WebDriverWait
-from webdriver_manager.chrome import ChromeDriverManager
-from webdriver_manager.microsoft import EdgeChromiumDriverManager
+
+from . import metrics
+
+if TYPE_CHECKING:
+    # The heavy dependencies are only imported when a real login is needed, see load_ocr and RUC_LOGIN
+    from selenium import webdriver
+    from selenium.webdriver.remote.webelement import WebElement
+
+    from .ocr import CodeMemo, SharedOCR
 
 PASSWORD_INPUT = True
 
 ROOT = os.path.dirname(os.path.abspath(__file__))
 INI_PATH = osp.join(ROOT, "config.ini")
+# cookies cache of ruclogin<=0.3.3, shared by all accounts, see cookies_path for the current one
 JW_COOKIES_PATH = osp.join(ROOT, "jw_cookies.pkl")
 V_COOKIES_PATH = osp.join(ROOT, "v_cookies.pkl")
 
+V_URL = "https://v.ruc.edu.cn"
+JW_URL = "https://jw.ruc.edu.cn"
+JW_CLIENT_ID = "5d25ae5b90f4d14aa601ede8.ruc"
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/133.0.0.0 Safari/537.36"
+
 loginer_instance = None
+http_loginer_instance = None
+login_lock = threading.Lock()  # a loginer instance can only do one login at a time
+driver_init_lock = threading.Lock()  # only one module-wide browser is started
+idle_timer = None  # closes the module-wide loginers when they are idle, see schedule_idle_close
+shared_session = None  # keep-alive session for the apis of v and jw, see get_session
+shared_session_size = 0
+shared_session_lock = threading.Lock()
 config = configparser.ConfigParser()
 
-onnxruntime.set_default_logger_severity(3)
-
 PRIVATE_INFO = 15
 logging.addLevelName(PRIVATE_INFO, "PRIVATE_INFO")
 
@@ -62,11 +89,11 @@ console_hd.setFormatter(logging.Formatter("%(message)s"))
 logger.addHandler(console_hd)
 
 
-def gen_semester_codes():
+def gen_semester_codes(years=4):
     now_year = datetime.datetime.now().year
     codes = [
         f"{y-1}-{y}-{s}"
-        for y in [now_year - 3, now_year - 2, now_year - 1, now_year]
+        for y in range(now_year - years + 1, now_year + 1)
         for s in [1, 2, 4]
     ]
     return ",".join(codes)
@@ -84,20 +111,195 @@ def code2semester(code="2023-2024-1"):
     return f"{y}学年{'春夏秋冬'[s-1]}季学期"
 
 
+# Scripts run in the login page, so that the driver is asked once per change instead of polled.
+# The status of the page is [failed reason shown to the user, src of the code image].
+STATUS_FN = """
+function status(alter, img) {
+    var visible = alter.getClientRects().length > 0;
+    return [visible ? alter.innerText.trim() : "", img.src];
+}
+"""
+
+STATUS_JS = STATUS_FN + "return status(arguments[0], arguments[1]);"
+
+# Resolves with the status once it differs from [lstText, lstSrc], a null lstText matches any failed reason.
+# Only an inline image is a new code, not the empty src of an image the page script has not set yet.
+WAIT_STATUS_JS = (
+    STATUS_FN
+    + """
+var alter = arguments[0], img = arguments[1], lstText = arguments[2], lstSrc = arguments[3];
+var done = arguments[arguments.length - 1];
+function changed() {
+    var s = status(alter, img);
+    var newImg = s[1] !== lstSrc && s[1].indexOf("data:") === 0;
+    return (lstText !== null && s[0] !== lstText) || newImg ? s : null;
+}
+var s = changed();
+if (s) {
+    done(s);
+    return;
+}
+var observer = new MutationObserver(function () {
+    var s = changed();
+    if (s) {
+        observer.disconnect();
+        done(s);
+    }
+});
+observer.observe(alter, {attributes: true, childList: true, subtree: true, characterData: true});
+observer.observe(img, {attributes: true, attributeFilter: ["src"]});
+"""
+)
+
+# Lean browsers do not download these, the code image is inline base64 and not affected.
+# Stylesheets are kept: whether the failed reason is shown depends on them.
+LEAN_BLOCKED_URLS = [
+    "*.png",
+    "*.jpg",
+    "*.jpeg",
+    "*.gif",
+    "*.svg",
+    "*.ico",
+    "*.webp",
+    "*.woff",
+    "*.woff2",
+    "*.ttf",
+    "*.otf",
+    "*.eot",
+    "*.mp3",
+    "*.mp4",
+]
+
+# Background services a one-shot login never needs.
+LEAN_ARGUMENTS = [
+    "--disable-background-networking",
+    "--disable-component-update",
+    "--disable-default-apps",
+    "--disable-sync",
+    "--disable-client-side-phishing-detection",
+    "--disable-domain-reliability",
+    "--disable-features=Translate,OptimizationHints,MediaRouter,InterestFeedContentSuggestions",
+    "--metrics-recording-only",
+    "--no-default-browser-check",
+    "--no-first-run",
+    "--no-pings",
+    "--mute-audio",
+]
+
+
+def load_ocr():
+    """The OCR shared by all loginers of the process, see ruclogin.ocr."""
+    from .ocr import get_ocr
+
+    return get_ocr()
+
+
+def load_memo():
+    """The solved-code memo shared by all loginers of the process, see ruclogin.ocr.CodeMemo."""
+    from .ocr import get_memo
+
+    return get_memo()
+
+
+def jw_authorize_url():
+    """The OAuth authorize url of jw.ruc.edu.cn, it redirects to jw with a code once v.ruc.edu.cn is logged in."""
+    return (
+        f"{V_URL}/oauth2/authorize?response_type=code&scope=all&state=yourstate"
+        f"&client_id={JW_CLIENT_ID}&redirect_uri={JW_URL}/secService/oauthlogin"
+    )
+
+
+def login_url(domain: str):
+    if domain.startswith("v"):
+        return f"{V_URL}/auth/login"
+    return f"{V_URL}/auth/login?&proxy=true&redirect_uri=" + quote(
+        jw_authorize_url(), safe=""
+    )
+
+
+def profile_dir(username=""):
+    """A persistent browser profile for username, to pass to RUC_LOGIN(profile=...)."""
+    global config
+    config.read(INI_PATH, encoding="utf-8")
+    username = username or config.get("base", "username", raw=True)
+    path = osp.join(cache_dir(), "profiles", re.sub(r"[^\w.-]", "_", username))
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def remembered_cookies(username):
+    """Cached v.ruc.edu.cn cookies of username that may still hold its SSO session, None if there are none."""
+    record = load_cache(cookies_path("v", username))
+    if cache_state(record) == "expired":
+        return None
+    return record["cookies"]
+
+
+def is_valid_code(ocrRes: str):
+    """The code is always 4 letters."""
+    if len(ocrRes) != 4:
+        return False
+    for c in ocrRes:
+        if not (ord("a") <= ord(c) <= ord("z") or ord("A") <= ord(c) <= ord("Z")):
+            return False
+    return True
+
+
+def check_status_msg(status_msg, username):
+    """Turn the failed reason shown by the login page into the result of a login attempt.
+
+    Returns:
+        bool: False if the code is wrong, True if there is no failed reason (success to login).
+    """
+    # 处理状态消息时避免格式化问题
+    if status_msg and "验证码不正确" in status_msg:
+        return False
+    elif status_msg and "用户不存在" in status_msg:
+        raise ValueError(
+            "用户不存在：\nusername: {}\tpassword：see {}".format(username, INI_PATH)
+        )
+    elif status_msg and "用户名或密码不正确" in status_msg:
+        raise ValueError(
+            "用户名或密码不正确：\nusername: {}\tpassword：see {}".format(
+                username, INI_PATH
+            )
+        )
+    elif status_msg:
+        # 避免直接使用可能包含%的文本
+        raise ValueError("Login failed, raw status msg: {}".format(repr(status_msg)))
+    return True
+
+
+def cookies_for(jar, url):
+    """Pick the cookies in a cookie jar that would be sent to url."""
+    host = urlparse(url).hostname
+    cookies = {}
+    for cookie in jar:
+        domain = cookie.domain.lstrip(".")
+        if domain.endswith(".local"):  # cookiejar stores cookies of dotless hosts like localhost as "localhost.local"
+            domain = domain[: -len(".local")]
+        if host == domain or host.endswith("." + domain):
+            cookies[cookie.name] = cookie.value
+    return cookies
+
+
 class RUC_LOGIN:
     """
     For developer:
     RUC_LOGIN works like this:
     1. __init__ function will initialize the webdriver, and read the config from the ini file.
-    2. initial_login function will get the elements in the login page, like input, button, etc.
-    3. get_img function will get the current image of the code.
+    2. initial_login function will load the login page, and find_form will get the elements in it, like input, button, etc.
+    3. get_img function will get the current image of the code,
+        wait_for_new_img and wait_for_status_change wait for the page to change with a MutationObserver in the browser.
     4. do_ocr function will try to do OCR for at most 100 times,
-        it only returns when the result is looks like a valid code(4 letters),
+        it only returns when the most likely code (4 letters) is confident enough,
         otherwise it will click the codeImg and try again.
     5. try_login function will use the do_ocr function to get the code, and then login.
+        With pipeline, the code is recognized in a background thread while the username and password are typed.
         Return False if the code is wrong (failed to login), else return True (success to login).
     6. login function will try to login for at most 20 times, raise TimeoutError if failed too many times.
-    7. after login, get_cookies function will get the cookies from the driver, and return it.
+    7. after login, get_cookies function will get the cookies of a domain from the driver, and return it,
+        jw cookies can be got after logging in for v by following the OAuth redirect.
 
     The reason why we use do_ocr function is because the ocr's recognition accuracy is not high,
     and it often makes obvious mistakes, we can recognize the code in advance and manually refresh a code.
@@ -111,16 +313,47 @@ class RUC_LOGIN:
     loginButton: WebElement
     login_alter: WebElement
     enableLogging: bool
+    domain: str
+    profile: str
+    warm: bool
     username: str
     password: str
-    ocr: ddddocr.DdddOcr
+    ocr: SharedOCR
+    memo: CodeMemo
     date: str
-    lst_img: bytes
+    lst_src: str
+    lst_raw: list
     lst_status: tuple
+    webdriver_calls: int
+    attempts: list
+    captchas: int
+    pipeline: bool
+    prefetched: Future
 
-    def __init__(self, debug=False) -> None:
+    def __init__(self, debug=False, pipeline=True, lean=False, profile=None) -> None:
+        """
+        Args:
+            debug (bool, optional): Show the browser. Defaults to False.
+            pipeline (bool, optional): Recognize the code in a background thread while typing username and password,
+                and recognize the next code as soon as a login attempt fails. Defaults to True.
+            lean (bool, optional): Block images, fonts and media, return from page loads once the DOM is ready,
+                and turn off background services of the browser. Defaults to False,
+                see benchmarks/bench_lean_browser.py for what it saves.
+            profile (str, optional): A persistent user data dir, so the session the browser remembers survives restarts.
+                Give each account its own, see profile_dir. Defaults to None, a throwaway profile.
+        """
+        self.profile = profile
         self.date = datetime.datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
-        self.ocr = ddddocr.DdddOcr(show_ad=False)
+        self.ocr = load_ocr()
+        self.memo = load_memo()
+        self.pipeline = pipeline
+        self.ocr_executor = ThreadPoolExecutor(1) if pipeline else None
+        self.prefetched = None
+        from selenium import webdriver
+        from selenium.webdriver.chrome.service import Service as ChromeService
+        from selenium.webdriver.edge.service import Service as EdgeService
+        from selenium.webdriver.support.ui import WebDriverWait
+
         global config
         config.read(INI_PATH, encoding="utf-8")
         browser = config["base"]["browser"]
@@ -139,73 +372,114 @@ class RUC_LOGIN:
                 options.add_argument("--log-level=3")
                 options.add_experimental_option("detach", True)
                 options.add_experimental_option("excludeSwitches", ["enable-logging"])
+            if profile:
+                options.add_argument(f"--user-data-dir={profile}")
+            if lean:
+                options.page_load_strategy = "eager"
+                for argument in LEAN_ARGUMENTS:
+                    options.add_argument(argument)
             return options
 
         if browser == "Chrome":
+            Driver, Service = webdriver.Chrome, ChromeService
             options = get_options(webdriver.ChromeOptions())
-            try:
-                self.driver = webdriver.Chrome(options=options)
-                logger.info("Using Chrome from PATH")
-            except Exception as e1:
-                try:
-                    logger.info(f"Failed to find Chrome in the PATH: {e1}")
-                    self.driver = webdriver.Chrome(
-                        options=options,
-                        service=ChromeService(ChromeDriverManager().install()),
-                    )
-                    logger.info("Using Chrome driver installed by webdriver_manager")
-                except Exception as e2:
-                    logger.info(
-                        f"Failed to download Chrome driver automatically using webdriver_manager: {e2}"
-                    )
-                    driver_path = config["base"]["driver"]
-                    if not osp.exists(driver_path):
-                        logger.error(
-                            f"Driver '{driver_path}' not found; attempts to locate Chrome in the PATH and download via webdriver_manager also failed"
-                        )
-                        raise RuntimeError(f"driver {driver_path} not found")
-                    self.driver = webdriver.Chrome(
-                        options=options,
-                        service=ChromeService(executable_path=driver_path),
-                    )
-                    logger.info(f"Using Chrome driver from {driver_path}")
         elif browser == "Edge":
+            Driver, Service = webdriver.Edge, EdgeService
             options = get_options(webdriver.EdgeOptions())
-            try:
-                self.driver = webdriver.Edge(options=options)
-                logger.info("Using Edge from PATH")
-            except Exception as e1:
+        else:
+            raise ValueError("browser must be Chrome or Edge")
+
+        self.driver = None
+        with metrics.timed("driver_init"):
+            resolved = load_resolved_driver(browser)
+            if resolved:
                 try:
-                    logger.info(f"Failed to find Edge in the PATH: {e1}")
-                    self.driver = webdriver.Edge(
-                        options=options,
-                        service=EdgeService(EdgeChromiumDriverManager().install()),
-                    )
-                    logger.info("Using Edge driver installed by webdriver_manager")
-                except Exception as e2:
-                    logger.info(
-                        f"Failed to download Edge driver automatically using webdriver_manager: {e2}"
-                    )
-                    driver_path = config["base"]["driver"]
-                    if not osp.exists(driver_path):
-                        logger.error(
-                            f"Driver '{driver_path}' not found; attempts to locate Edge in the PATH and download via webdriver_manager also failed"
-                        )
-                        raise RuntimeError(f"driver {driver_path} not found")
-                    self.driver = webdriver.Edge(
+                    if resolved["binary"]:
+                        options.binary_location = resolved["binary"]
+                    self.driver = Driver(
                         options=options,
-                        service=EdgeService(executable_path=driver_path),
+                        service=Service(executable_path=resolved["driver"]),
                     )
-                    logger.info(f"Using Edge driver from {driver_path}")
-        else:
-            raise ValueError("browser must be Chrome or Edge")
+                    logger.info(f"Using {browser} driver resolved before: {resolved['driver']}")
+                except Exception as e:
+                    logger.info(f"Failed to use the {browser} driver resolved before: {e}")
+                    options.binary_location = ""
+            if self.driver is None:
+                self.driver = self.resolve_driver(browser, Driver, Service, options)
+                save_resolved_driver(
+                    browser, self.driver.service.path, options.binary_location
+                )
+
+        if lean:
+            self.driver.execute_cdp_cmd("Network.enable", {})
+            self.driver.execute_cdp_cmd(
+                "Network.setBlockedURLs", {"urls": LEAN_BLOCKED_URLS}
+            )
 
         self.wait = WebDriverWait(self.driver, 10)
+        self.driver.set_script_timeout(10)
+
+        # count every WebDriver command, element commands go through driver.execute too
+        self.webdriver_calls = 0
+        execute = self.driver.execute
+
+        def counted_execute(*args, **kwargs):
+            self.webdriver_calls += 1
+            return execute(*args, **kwargs)
+
+        self.driver.execute = counted_execute
+
+    def resolve_driver(self, browser, Driver, Service, options):
+        """
+        Start the browser with the driver from PATH, else the one installed by webdriver_manager,
+        else the one in config.ini.
+        """
+        if browser == "Chrome":
+            from webdriver_manager.chrome import ChromeDriverManager as DriverManager
+        else:
+            from webdriver_manager.microsoft import (
+                EdgeChromiumDriverManager as DriverManager,
+            )
 
-    def initial_login(self, domain: str, username="", password=""):
+        try:
+            driver = Driver(options=options)
+            logger.info(f"Using {browser} from PATH")
+            return driver
+        except Exception as e1:
+            logger.info(f"Failed to find {browser} in the PATH: {e1}")
+        try:
+            driver = Driver(
+                options=options,
+                service=Service(DriverManager().install()),
+            )
+            logger.info(f"Using {browser} driver installed by webdriver_manager")
+            return driver
+        except Exception as e2:
+            logger.info(
+                f"Failed to download {browser} driver automatically using webdriver_manager: {e2}"
+            )
+        driver_path = config["base"]["driver"]
+        if not osp.exists(driver_path):
+            logger.error(
+                f"Driver '{driver_path}' not found; attempts to locate {browser} in the PATH and download via webdriver_manager also failed"
+            )
+            raise RuntimeError(f"driver {driver_path} not found")
+        driver = Driver(
+            options=options,
+            service=Service(executable_path=driver_path),
+        )
+        logger.info(f"Using {browser} driver from {driver_path}")
+        return driver
+
+    def initial_login(self, domain: str, username="", password="", remember=True):
         """
-        Update username and password, and get the elements in the login page.
+        Update username and password, load the login page and get the elements in it, see find_form.
+        With remember=False, the session of the account held by the browser or the cache is dropped
+        instead of restored, so that the form is always filled in.
         """
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support import expected_conditions as EC
+
         global config
         # 使用 raw 配置读取器来避免 % 解析问题
         config.read(INI_PATH, encoding="utf-8")
@@ -213,11 +487,65 @@ class RUC_LOGIN:
         self.password = password or config.get("base", "password", raw=True)
         self.enableLogging = config["base"].getboolean("enableLogging")
 
-        if domain.startswith("v"):
-            url = r"https://v.ruc.edu.cn/auth/login"
-        else:
-            url = r"https://v.ruc.edu.cn/auth/login?&proxy=true&redirect_uri=https%3A%2F%2Fv.ruc.edu.cn%2Foauth2%2Fauthorize%3Fresponse_type%3Dcode%26scope%3Dall%26state%3Dyourstate%26client_id%3D5d25ae5b90f4d14aa601ede8.ruc%26redirect_uri%3Dhttps%3A%2F%2Fjw.ruc.edu.cn%2FsecService%2Foauthlogin"
-        self.driver.get(url)
+        self.domain = domain
+        if not remember or self.profile_owner() != self.username:
+            # the browser may still hold the session of the account logged in before
+            self.driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+            self.set_profile_owner(self.username)
+        remembered = remembered_cookies(self.username) if remember else None
+        if remembered:
+            self.driver.execute_cdp_cmd(
+                "Network.setCookies",
+                {
+                    "cookies": [
+                        {"name": name, "value": value, "url": V_URL}
+                        for name, value in remembered.items()
+                    ]
+                },
+            )
+        self.attempts = []
+        self.prefetched = None
+        self.captchas = 0
+
+        with metrics.timed("page_load"):
+            self.driver.get(login_url(domain))
+            # a valid SSO session goes straight through to the redirect, there is no form to fill
+            form = self.wait.until(
+                EC.any_of(
+                    EC.element_to_be_clickable(
+                        (By.XPATH, "/html/body/div/form/div[3]/input")
+                    ),
+                    lambda driver: "/auth/login" not in driver.current_url,
+                )
+            )
+            # leaving the login page is no proof of a session, the server has to accept its cookies
+            self.warm = form is True and self.has_session()
+            if form is True and not self.warm:
+                logger.info("Left the login page without a valid session, log in with the form")
+                self.driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+                self.driver.get(login_url(domain))
+        if self.warm:
+            metrics.count("remembered_session")
+            logger.info("The remembered session is still valid, skip the login form")
+            return
+        with metrics.timed("element_lookup"):
+            self.find_form()
+
+    def has_session(self):
+        """Whether the browser holds v.ruc.edu.cn cookies the server accepts."""
+        raw_cookies = self.driver.execute_cdp_cmd(
+            "Network.getCookies", {"urls": [f"{V_URL}/auth/login", f"{V_URL}/"]}
+        )
+        cookies = {cookie["name"]: cookie["value"] for cookie in raw_cookies["cookies"]}
+        return "access_token" in cookies and bool(check_cookies(cookies, "v"))
+
+    def find_form(self):
+        """
+        Get the elements in the login page.
+        """
+        from selenium.common.exceptions import ElementClickInterceptedException
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support import expected_conditions as EC
 
         def try_click(by, value):
             ele = self.wait.until(EC.element_to_be_clickable((by, value)))
@@ -252,9 +580,25 @@ class RUC_LOGIN:
         self.rememberMe = self.driver.find_element(
             By.XPATH, "/html/body/div/form/div[13]/span[1]/div"
         ).click()
-        self.lst_img = None
+        self.lst_src = None
         self.lst_status = self.current_status()
 
+    def profile_owner(self):
+        """The account whose session the browser holds, None if unknown."""
+        if not self.profile:
+            return getattr(self, "owner", None)
+        try:
+            with open(osp.join(self.profile, "ruclogin_username"), encoding="utf-8") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def set_profile_owner(self, username):
+        self.owner = username
+        if self.profile:
+            with open(osp.join(self.profile, "ruclogin_username"), "w", encoding="utf-8") as f:
+                f.write(username)
+
     def get_img(self):
         """
         Get the current image of the code.
@@ -264,152 +608,625 @@ class RUC_LOGIN:
         img = base64.b64decode(img)
         return img
 
+    def make_status(self, raw):
+        if raw is None:  # 找不到元素，说明已经登录成功
+            return ("success", None, None)
+        # 直接返回原始文本，不做任何格式化
+        raw_text, src = raw
+        if raw_text and "%" in raw_text:
+            # 如果文本中包含%，进行特殊处理
+            raw_text = raw_text.replace("%", "%%")
+        return ("logging in", raw_text, src)
+
     def current_status(self):
+        """
+        ("logging in", failed reason, src of the code image), or ("success", None, None) if the page has left.
+        """
+        from selenium.common.exceptions import WebDriverException
+
         try:
-            # 直接返回原始文本，不做任何格式化
-            raw_text = self.login_alter.text
-            if raw_text and "%" in raw_text:
-                # 如果文本中包含%，进行特殊处理
-                raw_text = raw_text.replace("%", "%%")
-            return ("logging in", raw_text, self.get_img())
-        except StaleElementReferenceException:  # 找不到元素，说明已经登录成功
-            return ("success", None, None)
+            self.lst_raw = self.driver.execute_script(
+                STATUS_JS, self.login_alter, self.codeImg
+            )
+        except WebDriverException:  # stale element, or the page is navigating
+            self.lst_raw = None
+        return self.make_status(self.lst_raw)
+
+    def wait_for_status_change(self):
+        """
+        Wait in the browser until the failed reason or the code image changes, or the page leaves.
+        Return the last status if nothing changes in the script timeout.
+        """
+        from selenium.common.exceptions import TimeoutException, WebDriverException
+
+        if self.lst_raw is None:
+            return self.make_status(None)
+        try:
+            self.lst_raw = self.driver.execute_async_script(
+                WAIT_STATUS_JS, self.login_alter, self.codeImg, *self.lst_raw
+            )
+        except TimeoutException:
+            pass
+        except WebDriverException:  # the page is unloaded while waiting
+            return self.current_status()
+        return self.make_status(self.lst_raw)
 
     def wait_for_new_img(self):
-        waiting_time = 0
-        img = self.get_img()
-        while img == self.lst_img:
-            sleep(0.1)
-            waiting_time += 0.1
-            if waiting_time > 10:
-                raise TimeoutError("CodeImg refresh failed")
-            img = self.get_img()
-        self.lst_img = img
-        return img
+        """
+        Wait in the browser until the src of the code image differs from the last one used.
+        """
+        from selenium.common.exceptions import TimeoutException
+
+        if self.captchas:
+            metrics.count("captcha_refresh")
+        self.captchas += 1
+        try:
+            with metrics.timed("captcha_wait"):
+                _, src = self.driver.execute_async_script(
+                    WAIT_STATUS_JS, self.login_alter, self.codeImg, None, self.lst_src
+                )
+        except TimeoutException:
+            raise TimeoutError("CodeImg refresh failed")
+        self.lst_src = src
+        return base64.b64decode(src.split(",")[1])
 
     def do_ocr(self):
         """
         Try to do OCR for at most 100 times,
-        it only returns when the result is looks like a valid code(4 letters).
+        it only returns when the most likely code (4 letters) is confident enough to submit.
         """
-
-        def is_valid_result(ocrRes: str):
-            if len(ocrRes) != 4:
-                return False
-            for c in ocrRes:
-                if not (
-                    ord("a") <= ord(c) <= ord("z") or ord("A") <= ord(c) <= ord("Z")
-                ):
-                    return False
-            return True
-
         for _ in range(100):
             img = self.wait_for_new_img()
-            assert img == self.get_img()
-            ocrRes = self.ocr.classification(img)
-            if not is_valid_result(ocrRes):
+            ocrRes, confidence = self.memo.recognize(self.ocr, img)
+            if confidence < self.ocr.min_confidence:
+                metrics.count("ocr_reject")
                 self.codeImg.click()
             else:
                 return ocrRes, img
         raise TimeoutError("OCR failed")
 
+    def prefetch(self):
+        """
+        Start recognizing the next new code image in the background, return the future of (ocrRes, confidence, img).
+        """
+        img = self.wait_for_new_img()
+        return self.ocr_executor.submit(
+            lambda: (*self.memo.recognize(self.ocr, img), img)
+        )
+
     def try_login(self):
         """
         Use the do_ocr function to get the code, and then login.
         Return False if the code is wrong (failed to login), else return True (success to login).
         """
+        tic = timer()
+        calls = self.webdriver_calls
+        if self.pipeline:
+            prefetched = self.prefetched or self.prefetch()
+            self.prefetched = None
         self.usernameInput.clear()
         self.passwordInput.clear()
         self.codeInput.clear()
 
         self.usernameInput.send_keys(self.username)
         self.passwordInput.send_keys(self.password)
-        ocrRes, img = self.do_ocr()
+        if self.pipeline:
+            ocrRes, confidence, img = prefetched.result()
+            if confidence < self.ocr.min_confidence:
+                metrics.count("ocr_reject")
+                self.codeImg.click()
+                ocrRes, img = self.do_ocr()
+        else:
+            ocrRes, img = self.do_ocr()
         self.codeInput.send_keys(ocrRes)
 
-        self.loginButton.click()
-        while (
-            self.current_status() == self.lst_status
-            and self.current_status()[0] == "logging in"
-        ):
-            sleep(0.1)
         self.lst_status = self.current_status()
-        status_msg = self.lst_status[1]
-
-        # 处理状态消息时避免格式化问题
-        if status_msg and "验证码不正确" in status_msg:
-            return False
-        elif status_msg and "用户不存在" in status_msg:
-            raise ValueError(
-                "用户不存在：\nusername: {}\tpassword：see {}".format(
-                    self.username, INI_PATH
-                )
-            )
-        elif status_msg and "用户名或密码不正确" in status_msg:
-            raise ValueError(
-                "用户名或密码不正确：\nusername: {}\tpassword：see {}".format(
-                    self.username, INI_PATH
-                )
-            )
-        elif status_msg:
-            # 避免直接使用可能包含%的文本
-            raise ValueError(
-                "Login failed, raw status msg: {}".format(repr(status_msg))
+        time_to_submit = timer() - tic
+        metrics.count("login_attempt")
+        with metrics.timed("submit"):
+            self.loginButton.click()
+            status = self.wait_for_status_change()
+            while status == self.lst_status and status[0] == "logging in":
+                status = self.wait_for_status_change()
+        self.lst_status = status
+        if self.pipeline and status[0] == "logging in" and status[2] != self.lst_src:
+            # the page already shows the code for the next attempt
+            self.prefetched = self.prefetch()
+        self.attempts.append(
+            (timer() - tic, self.webdriver_calls - calls, time_to_submit)
+        )
+        logger.info(
+            "Login attempt {}: {:.3f}s, {} WebDriver calls, {:.3f}s to submit".format(
+                len(self.attempts), *self.attempts[-1]
             )
-        return True
+        )
+        success = check_status_msg(self.lst_status[1], self.username)
+        if not success:
+            metrics.count("wrong_code")
+        self.memo.record(img, ocrRes, success)
+        return success
 
     def get_cookies(self, domain="v"):
-        if domain.startswith("v"):
-            raw_cookies = self.driver.get_cookies()
-            cookies = {cookie["name"]: cookie["value"] for cookie in raw_cookies}
-            return cookies
-        elif domain.startswith("jw"):
-            [
-                self.driver.wait_for_request(
-                    url,
-                    timeout=10,
-                )
-                for url in [
-                    "/Njw2017/index.html*",
-                    "/secService/oauthlogin*",
-                ]
-            ]
-            cookies = {}
-            for request in self.driver.requests:
-                if request.response:
-                    cookie_header = request.response.headers["Set-Cookie"]
-                    if cookie_header:
-                        name, value = cookie_header.split(";")[0].split("=", 1)
-                        cookies.update({name: value})
-            return cookies
+        """
+        Cookies of domain after login, whichever domain initial_login was called with:
+        jw is reached by following its OAuth authorize redirect from the v session.
+        """
+        with metrics.timed("cookie_extraction", domain=domain.split(".")[0]):
+            if domain.startswith("v"):
+                urls = [f"{V_URL}/auth/login", f"{V_URL}/"]
+            elif domain.startswith("jw"):
+                from selenium.webdriver.support import expected_conditions as EC
+
+                if not self.domain.startswith("jw"):
+                    self.driver.get(jw_authorize_url())
+                    self.domain = "jw"
+                # the OAuth redirect ends at the jw index page, by then its cookies are set
+                self.wait.until(EC.url_contains("/Njw2017/index.html"))
+                urls = [f"{JW_URL}/secService/oauthlogin", f"{JW_URL}/Njw2017/index.html"]
+            raw_cookies = self.driver.execute_cdp_cmd("Network.getCookies", {"urls": urls})
+        cookies = {cookie["name"]: cookie["value"] for cookie in raw_cookies["cookies"]}
+        return cookies
 
     def login(self):
         """
         Try to login for at most 20 times, raise TimeoutError if failed too many times.
+        Nothing to do if the remembered session is still valid.
         """
+        if self.warm:
+            return
         for _ in range(20):
             success = self.try_login()
             if success:
                 return
         raise TimeoutError("Login failed, try too many times")
 
-    def __del__(self):
-        if hasattr(self, "driver"):
+    def close(self):
+        if getattr(self, "driver", None) is not None:
             self.driver.quit()
+            del self.driver
+        if getattr(self, "ocr_executor", None):
+            self.ocr_executor.shutdown(wait=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __del__(self):
+        self.close()
+        return
+
+
+class RUC_HTTP_LOGIN:
+    """
+    Browserless counterpart of RUC_LOGIN, with the same initial_login / login / get_cookies interface.
+    It speaks the JSON api behind the login page of v.ruc.edu.cn with a requests.Session on the pool of get_session:
+    1. initial_login function will clear the cookies of the session, restore the remembered session of the account
+        unless remember=False, and load the login page, which is skipped if the remembered session is still valid.
+    2. get_img function will fetch a new captcha, and remember its id.
+    3. do_ocr function works like RUC_LOGIN.do_ocr, but a new captcha is just another request.
+    4. try_login function will post the form, and parse the failed reason like RUC_LOGIN.try_login.
+    5. login function will try to login for at most 20 times.
+    6. get_cookies function will follow the OAuth redirect for jw, and return the cookies of the domain.
+    """
+
+    session: requests.Session
+    ocr: SharedOCR
+    memo: CodeMemo
+    warm: bool
+    username: str
+    password: str
+    captcha_id: str
+    captchas: int
+    timeout: float
+
+    def __init__(self, timeout=None) -> None:
+        """
+        Args:
+            timeout (float or tuple, optional): Seconds to wait for the server to connect and to answer.
+                Defaults to the timeouts in the [http] section of config.ini.
+        """
+        self.ocr = load_ocr()
+        self.memo = load_memo()
+        self.session = requests.Session()
+        self.session.headers.update({"User-Agent": USER_AGENT})
+        # its own cookie jar, over the connections, timeouts and retries of the module-wide session
+        shared = get_session()
+        for prefix in ["http://", "https://"]:
+            self.session.mount(prefix, shared.get_adapter(prefix))
+        self.timeout = timeout
+
+    def initial_login(self, domain: str, username="", password="", remember=True):
+        global config
+        config.read(INI_PATH, encoding="utf-8")
+        self.username = username or config.get("base", "username", raw=True)
+        self.password = password or config.get("base", "password", raw=True)
+        self.session.cookies.clear()
+        remembered = remembered_cookies(self.username) if remember else None
+        if remembered:
+            host = urlparse(V_URL).hostname
+            # cookiejar matches dotless hosts like localhost as "localhost.local"
+            cookie_domain = host if "." in host else host + ".local"
+            for name, value in remembered.items():
+                self.session.cookies.set(name, value, domain=cookie_domain, path="/")
+        with metrics.timed("page_load"):
+            response = self.session.get(login_url(domain), timeout=self.timeout)
+            # leaving the login page is no proof of a session, the server has to accept its cookies
+            cookies = cookies_for(self.session.cookies, V_URL)
+            left = urlparse(response.url).path != "/auth/login"
+            self.warm = left and "access_token" in cookies and bool(
+                check_cookies(cookies, "v", timeout=self.timeout)
+            )
+            if left and not self.warm:
+                logger.info("Left the login page without a valid session, log in with the form")
+                self.session.cookies.clear()
+                self.session.get(login_url(domain), timeout=self.timeout)
+        if self.warm:
+            metrics.count("remembered_session")
+            logger.info("The remembered session is still valid, skip the login form")
+        self.captcha_id = None
+        self.captchas = 0
+
+    def get_img(self):
+        if self.captchas:
+            metrics.count("captcha_refresh")
+        self.captchas += 1
+        with metrics.timed("captcha_wait"):
+            response = self.session.get(f"{V_URL}/auth/captcha", timeout=self.timeout)
+            data = response.json()
+        self.captcha_id = data["id"]
+        return base64.b64decode(data["b64s"].split(",")[-1])
+
+    def do_ocr(self):
+        for _ in range(100):
+            img = self.get_img()
+            ocrRes, confidence = self.memo.recognize(self.ocr, img)
+            if confidence >= self.ocr.min_confidence:
+                return ocrRes, img
+            metrics.count("ocr_reject")
+        raise TimeoutError("OCR failed")
+
+    def try_login(self):
+        ocrRes, img = self.do_ocr()
+        metrics.count("login_attempt")
+        with metrics.timed("submit"):
+            response = self.session.post(
+                f"{V_URL}/auth/login",
+                json={
+                    "username": f"ruc:{self.username}",
+                    "password": self.password,
+                    "code": ocrRes,
+                    "remember_me": "true",
+                    "redirect_uri": "/",
+                    "twofactor_password": "",
+                    "twofactor_recovery": "",
+                    "token": "",
+                    "captcha_id": self.captcha_id,
+                },
+                timeout=self.timeout,
+            )
+        try:
+            data = response.json()
+        except ValueError:
+            data = {}
+        status_msg = None
+        if isinstance(data, dict):
+            status_msg = data.get("error_description") or data.get("message")
+        if not status_msg and not response.ok:
+            status_msg = f"HTTP {response.status_code}"
+        success = check_status_msg(status_msg, self.username)
+        if not success:
+            metrics.count("wrong_code")
+        self.memo.record(img, ocrRes, success)
+        return success
+
+    def get_cookies(self, domain="v"):
+        with metrics.timed("cookie_extraction", domain=domain.split(".")[0]):
+            if domain.startswith("v"):
+                return cookies_for(self.session.cookies, V_URL)
+            elif domain.startswith("jw"):
+                self.session.get(jw_authorize_url(), timeout=self.timeout)
+                return cookies_for(self.session.cookies, JW_URL)
+
+    def login(self):
+        if self.warm:
+            return
+        for _ in range(20):
+            success = self.try_login()
+            if success:
+                return
+        raise TimeoutError("Login failed, try too many times")
+
+    def close(self):
+        # the adapters, and their keep-alive connections, belong to get_session and stay open
+        self.session.adapters.clear()
+        self.session.cookies.clear()
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def driver_init(debug=False, background=False):
+    """Start the module-wide browser if it is not running, and return its loginer.
+
+    Args:
+        background (bool, optional): Start it in a background thread and return a Future of the loginer,
+            so that the startup overlaps with whatever the caller does next. Defaults to False.
+    """
+    global loginer_instance, config
+    if background:
+        future = Future()
+
+        def run():
+            try:
+                future.set_result(driver_init(debug))
+            except BaseException as e:
+                future.set_exception(e)
+
+        threading.Thread(target=run, daemon=True).start()
+        return future
+    with driver_init_lock:
+        if loginer_instance is None:
+            config.read(INI_PATH, encoding="utf-8")
+            profile = profile_dir() if config.getboolean("base", "profile", fallback=False) else None
+            lean = config.getboolean("base", "lean", fallback=False)
+            loginer_instance = RUC_LOGIN(debug=debug, lean=lean, profile=profile)
+    return loginer_instance
+
+
+def http_init():
+    global http_loginer_instance
+    if http_loginer_instance is None:
+        http_loginer_instance = RUC_HTTP_LOGIN()
+
+
+class FileLock:
+    """
+    An exclusive lock on a file, held across processes and across threads of one process.
+
+    with FileLock(path + ".lock"):
+        ...
+    """
+
+    def __init__(self, path, timeout=None) -> None:
+        self.path = path
+        self.timeout = timeout
+        self.fd = None
+
+    def try_lock(self):
+        try:
+            if fcntl:
+                fcntl.flock(self.fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                msvcrt.locking(self.fd, msvcrt.LK_NBLCK, 1)
+        except OSError:
+            return False
+        return True
+
+    def acquire(self):
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        waiting_time = 0
+        while not self.try_lock():
+            sleep(0.05)
+            waiting_time += 0.05
+            if self.timeout is not None and waiting_time > self.timeout:
+                os.close(self.fd)
+                self.fd = None
+                raise TimeoutError(f"Failed to lock {self.path}")
+
+    def release(self):
+        if fcntl:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+        else:
+            os.lseek(self.fd, 0, os.SEEK_SET)
+            msvcrt.locking(self.fd, msvcrt.LK_UNLCK, 1)
+        os.close(self.fd)
+        self.fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def cache_dir():
+    """Directory of the cookies cache: $RUCLOGIN_CACHE_DIR, else dir in config.ini, else the package directory."""
+    global config
+    config.read(INI_PATH, encoding="utf-8")
+    path = os.environ.get("RUCLOGIN_CACHE_DIR") or config.get(
+        "cache", "dir", fallback=""
+    )
+    if not path:
+        return ROOT
+    path = osp.expanduser(path)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def is_loopback(host):
+    """Whether host only accepts connections from this machine."""
+    try:
+        return ipaddress.ip_address(socket.gethostbyname(host)).is_loopback
+    except (OSError, ValueError):
+        return False
+
+
+def local_authkey(section, host=None):
+    """The authkey of the server of section ("ocr" or "broker") in config.ini.
+
+    Without authkey in that section, a random key is generated on first use and kept
+    in {section}.key of the cache directory, readable only by its owner, so that only
+    processes of that user find the server. It cannot reach other hosts.
+
+    Raises:
+        ValueError: if host is given and is not a loopback address, but no authkey is set.
+    """
+    global config
+    config.read(INI_PATH, encoding="utf-8")
+    text = config.get(section, "authkey", fallback="", raw=True)
+    if text:
+        return text.encode()
+    if host is not None and not is_loopback(host):
+        raise ValueError(f"Set authkey in the [{section}] section of {INI_PATH} to listen on {host}")
+    path = osp.join(cache_dir(), f"{section}.key")
+
+    def read():
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    key = read()
+    if key:
+        return key
+    with FileLock(path + ".lock"):
+        key = read()
+        if key:
+            return key
+        # an empty file, left by a crash, would be a key anyone knows: write a new one like save_cache,
+        # mkstemp creates it readable only by its owner, and readers never see it partly written
+        key = secrets.token_hex(32).encode()
+        fd, tmp_path = tempfile.mkstemp(dir=osp.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(key)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        return key
+
+
+def resolved_driver_path():
+    return osp.join(cache_dir(), "resolved_driver.pkl")
+
+
+def driver_version(driver_path):
+    """Output of `driver --version`, like "ChromeDriver 130.0.6723.91 (...)", None if it does not run."""
+    try:
+        result = subprocess.run(
+            [driver_path, "--version"], capture_output=True, text=True, timeout=10
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return result.stdout.strip() or None
+
+
+def load_resolved_driver(browser):
+    """The driver (and browser binary) that started browser last time, None if the driver binary has changed since.
+
+    Returns:
+        optional[dict]: {"driver": str, "version": str, "binary": str}
+    """
+    try:
+        with open(resolved_driver_path(), "rb") as f:
+            resolved = pickle.load(f)[browser]
+    except (OSError, EOFError, pickle.UnpicklingError, KeyError):
+        return None
+    if driver_version(resolved["driver"]) != resolved["version"]:
+        return None
+    return resolved
+
+
+def save_resolved_driver(browser, driver_path, binary=""):
+    try:
+        with open(resolved_driver_path(), "rb") as f:
+            resolved = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        resolved = {}
+    version = driver_version(driver_path)
+    if version is None:
         return
+    resolved[browser] = {"driver": driver_path, "version": version, "binary": binary}
+    save_cache(resolved_driver_path(), resolved)
+
+
+def clear_resolved_driver():
+    try:
+        os.remove(resolved_driver_path())
+    except FileNotFoundError:
+        pass
+
+
+def cookies_path(domain: str, username=""):
+    """Cache path of the cookies of username on domain, username defaults to the one in config.ini."""
+    global config
+    if not username:
+        config.read(INI_PATH, encoding="utf-8")
+        username = config.get("base", "username", raw=True)
+    username = re.sub(r"[^\w.-]", "_", username)
+    return osp.join(cache_dir(), f"{domain.split('.')[0]}_cookies_{username}.pkl")
+
 
+def clear_cookies(username=None):
+    """Remove the cached cookies of username, or of all accounts if username is None."""
+    if username is None:
+        paths = glob(osp.join(cache_dir(), "*_cookies*.pkl"))
+        paths += [JW_COOKIES_PATH, V_COOKIES_PATH]
+    else:
+        paths = [cookies_path(domain, username) for domain in ["v", "jw"]]
+    for path in paths:
+        if osp.exists(path):
+            os.remove(path)
 
-def driver_init(debug=False):
-    global loginer_instance
-    if loginer_instance is None:
-        loginer_instance = RUC_LOGIN(debug=debug)
 
+def load_cache(cache_path):
+    """Load a cookies cache file.
 
-def get_cookies(cache=True, domain="v", retry=3, username="", password="") -> dict:
+    Returns:
+        optional[dict]: {"cookies": dict, "issued_at": float, "validated_at": float}, None if there is no usable cache.
+    """
+    try:
+        with open(cache_path, "rb") as f:
+            record = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+    if "cookies" not in record:
+        # cache written by ruclogin<=0.3.3 is the cookies dict itself, it has never been validated
+        record = {
+            "cookies": record,
+            "issued_at": osp.getmtime(cache_path),
+            "validated_at": 0,
+        }
+    return record
+
+
+def save_cache(cache_path, record):
+    """Write the cache to a temporary file and rename it, so readers never see a partial file."""
+    fd, tmp_path = tempfile.mkstemp(dir=osp.dirname(cache_path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(record, f)
+        os.replace(tmp_path, cache_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def get_cookies(
+    cache=True,
+    domain="v",
+    retry=3,
+    username="",
+    password="",
+    engine=None,
+    fresh=None,
+    ttl=None,
+    loginer_pool=None,
+    broker=None,
+) -> dict:
     """Get cookies from cache or selenium login.
 
     Args:
-        cache (bool, optional): Force regain when set to False. Defaults to True.
+        cache (bool, optional): Force regain when set to False, with a new login even if the remembered session is still valid. Defaults to True.
 
         domain (str, optional): "v", "jw", "v.ruc.edu.cn", "jw.ruc.edu.cn". Defaults to "v".
 
@@ -417,62 +1234,325 @@ def get_cookies(cache=True, domain="v", retry=3, username="", password="") -> di
 
         password (str, optional)
 
+        engine (str, optional): "selenium" or "http", the latter logs in without a browser. Defaults to the engine in config.ini.
+
+        fresh (float, optional): Seconds after the last validation in which cached cookies are returned without checking them. Defaults to fresh in config.ini.
+
+        ttl (float, optional): Seconds after login after which cached cookies are regained without checking them. Defaults to ttl in config.ini.
+
+        loginer_pool (LoginerPool, optional): Login with a loginer leased from the pool, so that logins in several threads run in parallel.
+
+        broker (bool, optional): Ask the cookie broker started by `ruclogin serve` first, and only log in here if it is not running.
+            cache=False asks it to log in again. Defaults to client in the [broker] section of config.ini.
+
     Returns:
         dict: Like {'tiup_uid': '6112329b90f4d162e19b83c9', 'access_token': 'rhMSVympSBON2Xr8yAdhnQ'}
     """
-    global loginer_instance
     domain = domain.split(".")[0]
-    cache_path = osp.join(ROOT, f"{domain}_cookies.pkl")
+    if broker is None:
+        config.read(INI_PATH, encoding="utf-8")
+        broker = config.getboolean("broker", "client", fallback=False)
+    if broker:
+        from .broker import ask_broker
+
+        cookies = ask_broker(domain, username, password, refresh=not cache)
+        if cookies is not None:
+            return cookies
+    cache_path = cookies_path(domain, username)
     if cache:
-        if osp.exists(cache_path):
-            try:
-                cookies = pickle.load(open(cache_path, "rb"))
-                if check_cookies(cookies, domain):
-                    return cookies
-            except EOFError as e:
-                pass
-    driver_init()
-    try:
-        loginer_instance.initial_login(domain, username, password)
-        loginer_instance.login()
-        cookies = loginer_instance.get_cookies(domain)
-        if not cookies:
-            raise RuntimeError("Login failed, cookies are empty, please try again")
-    except RuntimeError as e:
-        logger.warning(f"retry {retry}: {e}")
-        if retry == 1:
-            raise e
-        else:
-            get_cookies(cache=False, domain=domain, retry=retry - 1)
-    pickle.dump(cookies, open(cache_path, "wb"))
+        record = load_cache(cache_path)
+        state = cache_state(record, fresh, ttl)
+        if state == "fresh":
+            metrics.count("cache_hit", domain=domain)
+            return record["cookies"]
+        if state == "stale" and check_cookies(record["cookies"], domain):
+            record = mark_validated(cache_path, record)
+            metrics.count("cache_hit", domain=domain)
+            return record["cookies"]
+        metrics.count("cache_miss", domain=domain)
+    return regain_cookies(
+        cache_path, domain, username, password, engine, retry, cache, loginer_pool
+    )
+
+
+def cache_state(record, fresh=None, ttl=None):
+    """Where a cache record is in its life.
+
+    Returns:
+        str: "fresh" to use it as is, "stale" to check it first, "expired" (or no record) to regain it.
+    """
+    global config
+    if not record:
+        return "expired"
+    config.read(INI_PATH, encoding="utf-8")
+    if fresh is None:
+        fresh = config.getfloat("cache", "fresh", fallback=300)
+    if ttl is None:
+        ttl = config.getfloat("cache", "ttl", fallback=86400)
+    now = time()
+    if now - record["issued_at"] >= ttl:
+        return "expired"
+    if now - record["validated_at"] < fresh:
+        return "fresh"
+    return "stale"
+
+
+def mark_validated(cache_path, record):
+    """Save that record, loaded from cache_path, was just validated.
+
+    Under the lock of the entry, and only if it has not been regained since it was loaded,
+    so that the old cookies are never written back over new ones.
+
+    Returns:
+        dict: The record now in the cache, the regained one if it was regained meanwhile.
+    """
+    with FileLock(cache_path + ".lock"):
+        current = load_cache(cache_path)
+        if current and current["issued_at"] != record["issued_at"]:
+            return current
+        record["validated_at"] = time()
+        save_cache(cache_path, record)
+    return record
+
+
+def regain_cookies(
+    cache_path,
+    domain,
+    username="",
+    password="",
+    engine=None,
+    retry=3,
+    cache=True,
+    loginer_pool=None,
+):
+    """Login and save the cookies to cache_path, once for all processes asking at the same time."""
+    started = time()
+    # single-flight: while one process logs in, the others wait here for its cookies
+    with FileLock(cache_path + ".lock"):
+        if cache:
+            record = load_cache(cache_path)
+            if record and record["issued_at"] >= started:
+                return record["cookies"]
+        cookies = login_cookies(
+            domain, username, password, engine, retry, loginer_pool, remember=cache
+        )
+        now = time()
+        save_cache(
+            cache_path, {"cookies": cookies, "issued_at": now, "validated_at": now}
+        )
     return cookies
 
 
-def check_cookies(cookies, domain="v"):
-    """Check if cookies are valid.
+def get_all_cookies(
+    domains=("v", "jw"),
+    cache=True,
+    retry=3,
+    username="",
+    password="",
+    engine=None,
+    fresh=None,
+    ttl=None,
+    loginer_pool=None,
+    broker=None,
+) -> dict:
+    """Get cookies of several domains like get_cookies, with one login for all that miss the cache.
+
+    jw is an OAuth client of v.ruc.edu.cn, so its cookies come from following the authorize
+    redirect of the logged in v session, without a second code. With broker, the cookie broker
+    is asked for every domain first, only the domains it does not answer are looked up here.
+
+    Returns:
+        dict: {domain: cookies}, like {"v": {...}, "jw": {...}}
+    """
+    domains = [domain.split(".")[0] for domain in domains]
+    all_cookies = {}
+    if broker is None:
+        config.read(INI_PATH, encoding="utf-8")
+        broker = config.getboolean("broker", "client", fallback=False)
+    if broker:
+        from .broker import ask_broker
+
+        for domain in domains:
+            cookies = ask_broker(domain, username, password, refresh=not cache)
+            if cookies is None:  # no broker running
+                break
+            all_cookies[domain] = cookies
+    if cache:
+        for domain in domains:
+            if domain in all_cookies:
+                continue
+            cache_path = cookies_path(domain, username)
+            record = load_cache(cache_path)
+            state = cache_state(record, fresh, ttl)
+            if state == "stale" and check_cookies(record["cookies"], domain):
+                record = mark_validated(cache_path, record)
+                state = "fresh"
+            if state == "fresh":
+                all_cookies[domain] = record["cookies"]
+            metrics.count("cache_hit" if state == "fresh" else "cache_miss", domain=domain)
+    missing = [domain for domain in domains if domain not in all_cookies]
+    if missing:
+        all_cookies.update(
+            regain_all_cookies(
+                missing, username, password, engine, retry, cache, loginer_pool
+            )
+        )
+    return {domain: all_cookies[domain] for domain in domains}
+
+
+def regain_all_cookies(
+    domains,
+    username="",
+    password="",
+    engine=None,
+    retry=3,
+    cache=True,
+    loginer_pool=None,
+):
+    """regain_cookies for several domains with one login, holding the locks of all of them."""
+    started = time()
+    cache_paths = {domain: cookies_path(domain, username) for domain in domains}
+    all_cookies = {}
+    with ExitStack() as stack:
+        # always lock in the same order, so that two callers never wait for each other
+        for cache_path in sorted(cache_paths.values()):
+            stack.enter_context(FileLock(cache_path + ".lock"))
+        if cache:
+            for domain, cache_path in cache_paths.items():
+                record = load_cache(cache_path)
+                if record and record["issued_at"] >= started:
+                    all_cookies[domain] = record["cookies"]
+        missing = [domain for domain in domains if domain not in all_cookies]
+        if missing:
+            regained = login_all_cookies(
+                missing, username, password, engine, retry, loginer_pool, remember=cache
+            )
+            now = time()
+            for domain, cookies in regained.items():
+                save_cache(
+                    cache_paths[domain],
+                    {"cookies": cookies, "issued_at": now, "validated_at": now},
+                )
+            all_cookies.update(regained)
+    return all_cookies
+
+
+@contextmanager
+def shared_loginer(engine):
+    """Lease the module-wide loginer instance of engine, one login at a time.
+    It is created on first use, and again after it has been closed for being idle."""
+    with login_lock:
+        try:
+            if engine == "http":
+                http_init()
+                yield http_loginer_instance
+            else:
+                driver_init()
+                yield loginer_instance
+        finally:
+            schedule_idle_close()
+
+
+def schedule_idle_close():
+    """Close the module-wide loginers once they have not been used for idle_timeout seconds (config.ini)."""
+    global idle_timer, config
+    config.read(INI_PATH, encoding="utf-8")
+    idle_timeout = config.getfloat("base", "idle_timeout", fallback=300)
+    if idle_timer is not None:
+        idle_timer.cancel()
+    if idle_timeout > 0:
+        idle_timer = threading.Timer(idle_timeout, close_loginers)
+        idle_timer.daemon = True
+        idle_timer.start()
+
+
+def close_loginers():
+    """Quit the module-wide browser and drop the other module-wide loginer and the OCR model,
+    they are created again by the next login. Does nothing while a login is running."""
+    global loginer_instance, http_loginer_instance
+    if not login_lock.acquire(blocking=False):
+        return  # the running login schedules the next check when it ends
+    try:
+        with driver_init_lock:
+            for loginer in [loginer_instance, http_loginer_instance]:
+                if loginer is not None:
+                    loginer.close()
+            loginer_instance = http_loginer_instance = None
+        from .ocr import release_ocr
+
+        release_ocr()
+        logger.info("Closed the idle loginers")
+    finally:
+        login_lock.release()
+
+
+def login_cookies(
+    domain: str, username="", password="", engine=None, retry=3, loginer_pool=None, remember=True
+):
+    """Login and get cookies, without touching the cache.
 
     Args:
-        cookies (dict): Like {'tiup_uid': '6112329b90f4d162e19b83c9', 'access_token': 'rhMSVympSBON2Xr8yAdhnQ'}
+        loginer_pool (LoginerPool, optional): Lease a loginer from it instead of using the module-wide one.
+
+        remember (bool, optional): Reuse the remembered SSO session of the account if it is still valid,
+            False to always fill in the login form. Defaults to True.
+
+    Raises:
+        RuntimeError: if failed to get cookies for retry times.
+    """
+    return login_all_cookies(
+        [domain], username, password, engine, retry, loginer_pool, remember
+    )[domain]
 
-        domain (str, optional): "v", "jw", "v.ruc.edu.cn", "jw.ruc.edu.cn". Defaults to "v".
+
+def login_all_cookies(
+    domains, username="", password="", engine=None, retry=3, loginer_pool=None, remember=True
+):
+    """Login once and get the cookies of every domain, without touching the cache.
 
     Returns:
-        optional[str]: None if cookies are invalid, else a greeting message.
+        dict: {domain: cookies}
     """
-    try:
-        if domain.startswith("v"):
-            response = requests.get(
-                "https://v.ruc.edu.cn/v3/api/me/roles",
+    global config
+    if engine is None:
+        config.read(INI_PATH, encoding="utf-8")
+        engine = config["base"].get("engine", "selenium")
+    if engine not in ["selenium", "http"]:
+        raise ValueError("engine must be selenium or http")
+    for retry in range(retry, 0, -1):
+        try:
+            lease = loginer_pool.lease() if loginer_pool else shared_loginer(engine)
+            with lease as loginer:
+                loginer.initial_login(domains[0], username, password, remember)
+                loginer.login()
+                all_cookies = {domain: loginer.get_cookies(domain) for domain in domains}
+            if not all(all_cookies.values()):
+                raise RuntimeError("Login failed, cookies are empty, please try again")
+            return all_cookies
+        except RuntimeError as e:
+            logger.warning(f"retry {retry}: {e}")
+            if retry == 1:
+                raise e
+
+
+def check_request(cookies, domain="v", detail=False):
+    """The request check_cookies sends, as (method, url, kwargs) for requests or httpx."""
+    if domain.startswith("v"):
+        return (
+            "GET",
+            f"{V_URL}/v3/api/me/roles",
+            dict(
                 cookies=cookies,
                 headers={
-                    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/133.0.0.0 Safari/537.36",
+                    "User-Agent": USER_AGENT,
                 },
-            )
-            role = response.json()["data"][-1]
-            return f"你好, {role['departmentname']} {role['username']}"
-        elif domain.startswith("jw"):
-            response = requests.post(
-                "https://jw.ruc.edu.cn/resService/jwxtpt/v1/xsd/cjgl_xsxdsq/professionalRankingQuery",
+            ),
+        )
+    elif domain.startswith("jw"):
+        return (
+            "POST",
+            f"{JW_URL}/resService/jwxtpt/v1/xsd/cjgl_xsxdsq/professionalRankingQuery",
+            dict(
                 params={
                     "resourceCode": "XSMH0527",
                     "apiCode": "jw.xsd.xsdInfo.controller.CjglKccjckController.professionalRankingQuery",
@@ -481,26 +1561,237 @@ def check_cookies(cookies, domain="v"):
                 headers={
                     "Accept": "application/json, text/plain, */*",
                     "TOKEN": cookies["token"],
-                    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/133.0.0.0 Safari/537.36",
+                    "User-Agent": USER_AGENT,
                 },
-                json={"jczy013id": gen_semester_codes()},
-            )
-            d = response.json()["data"][0]
-            return "你好，{} {}，你一共修了{}学分，{}门课，平均绩点{}，专业排名第{}名".format(
-                d["ndzy_name"],
-                d["xs_name"],
-                d["sdxf"],
-                d["countnum"],
-                d["pjxfjd"],
-                d["pm"],
-            )
+                json={"jczy013id": gen_semester_codes(4 if detail else 1)},
+            ),
+        )
+    raise ValueError(f"unknown domain {domain}")
+
+
+def check_response(data, domain="v", detail=False):
+    """Turn the json check_request got into the result of check_cookies, raise if it is not valid."""
+    if domain.startswith("v"):
+        role = data["data"][-1]
+        return f"你好, {role['departmentname']} {role['username']}"
+    data = data["data"]
+    if not detail:
+        return "你好，jw.ruc.edu.cn cookies 有效" if isinstance(data, list) else None
+    d = data[0]
+    return "你好，{} {}，你一共修了{}学分，{}门课，平均绩点{}，专业排名第{}名".format(
+        d["ndzy_name"],
+        d["xs_name"],
+        d["sdxf"],
+        d["countnum"],
+        d["pjxfjd"],
+        d["pm"],
+    )
+
+
+def check_cookies(cookies, domain="v", detail=False, timeout=None):
+    """Check if cookies are valid.
+
+    Args:
+        cookies (dict): Like {'tiup_uid': '6112329b90f4d162e19b83c9', 'access_token': 'rhMSVympSBON2Xr8yAdhnQ'}
+
+        domain (str, optional): "v", "jw", "v.ruc.edu.cn", "jw.ruc.edu.cn". Defaults to "v".
+
+        detail (bool, optional): For jw, query the ranking of the last 4 years for the greeting message,
+            instead of only probing the latest year. Defaults to False.
+
+        timeout (float or tuple, optional): Seconds to wait for the server to connect and to answer.
+            Defaults to connect_timeout and read_timeout in the [http] section of config.ini.
+
+    Returns:
+        optional[str]: None if cookies are invalid, else a greeting message.
+    """
+    try:
+        method, url, kwargs = check_request(cookies, domain, detail)
+        with metrics.timed("validation", domain=domain.split(".")[0]):
+            response = get_session().request(method, url, timeout=timeout, **kwargs)
+        return check_response(response.json(), domain, detail)
     except:
         return None
 
 
+class TimeoutHTTPAdapter(requests.adapters.HTTPAdapter):
+    """An HTTPAdapter with a default timeout for the requests that do not set one."""
+
+    def __init__(self, timeout=None, **kwargs) -> None:
+        self.timeout = timeout
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        return super().send(request, **kwargs)
+
+
+def http_settings():
+    """The [http] section of config.ini."""
+    global config
+    config.read(INI_PATH, encoding="utf-8")
+    return {
+        "timeout": (
+            config.getfloat("http", "connect_timeout", fallback=5),
+            config.getfloat("http", "read_timeout", fallback=10),
+        ),
+        "retries": config.getint("http", "retries", fallback=2),
+        "backoff": config.getfloat("http", "backoff", fallback=0.3),
+        "pool_size": config.getint("http", "pool_size", fallback=10),
+    }
+
+
+def get_session(size=0):
+    """The module-wide requests.Session for the apis of v.ruc.edu.cn and jw.ruc.edu.cn.
+
+    Connections are kept alive and pooled per host, at least size of them, requests without a timeout
+    get the one in config.ini, and connection errors, and 502/503/504 answers to idempotent requests,
+    are retried with backoff. The session never stores cookies, so that it can be shared by every account:
+    pass them to each request instead, like
+
+        get_session().get(f"{V_URL}/v3/api/me/roles", cookies=get_cookies())
+
+    Args:
+        size (int, optional): Connections per host, for that many threads. Defaults to pool_size in config.ini.
+    """
+    global shared_session, shared_session_size
+    from urllib3.util.retry import Retry
+
+    with shared_session_lock:
+        if shared_session is None or shared_session_size < size:
+            settings = http_settings()
+            size = max(size, settings["pool_size"])
+            retries = settings["retries"]
+            adapter = TimeoutHTTPAdapter(
+                timeout=settings["timeout"],
+                pool_connections=4,
+                pool_maxsize=size,
+                max_retries=Retry(
+                    total=retries,
+                    connect=retries,
+                    read=retries,
+                    status=retries,
+                    backoff_factor=settings["backoff"],
+                    status_forcelist=[502, 503, 504],
+                    raise_on_status=False,
+                ),
+            )
+            session = requests.Session()
+            session.headers.update({"User-Agent": USER_AGENT})
+            session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            # a smaller session still in use by another thread is left to the garbage collector
+            shared_session, shared_session_size = session, size
+        return shared_session
+
+
+def close_session():
+    """Close the module-wide session, get_session creates it again with the current config.ini."""
+    global shared_session, shared_session_size
+    with shared_session_lock:
+        if shared_session is not None:
+            shared_session.close()
+        shared_session, shared_session_size = None, 0
+
+
+def check_one(session, cookies, domain="v", detail=False, timeout=None):
+    """check_cookies with session, as a result of check_cookies_many."""
+    tic = timer()
+    status, message = "invalid", None
+    try:
+        method, url, kwargs = check_request(cookies, domain, detail)
+        with metrics.timed("validation", domain=domain.split(".")[0]):
+            response = session.request(method, url, timeout=timeout, **kwargs)
+        message = check_response(response.json(), domain, detail)
+        if message:
+            status = "valid"
+    except requests.Timeout as e:
+        status, message = "timeout", str(e)
+    except requests.RequestException as e:
+        from urllib3.exceptions import NewConnectionError
+        from urllib3.exceptions import TimeoutError as RetriedTimeout
+
+        # a timeout that ran out of retries comes as a ConnectionError,
+        # a refused connection is a ConnectTimeoutError to urllib3
+        reason = getattr(e.args[0], "reason", None) if e.args else None
+        timed_out = isinstance(reason, RetriedTimeout) and not isinstance(reason, NewConnectionError)
+        status = "timeout" if timed_out else "error"
+        message = str(e)
+    except Exception:  # missing cookies, or an answer that is not for valid cookies
+        pass
+    return {
+        "domain": domain.split(".")[0],
+        "status": status,
+        "message": message,
+        "latency": timer() - tic,
+    }
+
+
+def check_cookies_many(items, concurrency=8, timeout=None, detail=False):
+    """Check many cookies at the same time, over the keep-alive connections of get_session.
+
+    Args:
+        items (list): [(cookies, domain), ...]
+
+        concurrency (int, optional): Checks running at the same time. Defaults to 8.
+
+        timeout (float or tuple, optional): Seconds a check waits for the server to connect and to answer.
+            The call returns at the latest when every check could have used it with all its retries,
+            the checks still running are reported as "timeout". Defaults to the timeouts in config.ini.
+
+        detail (bool, optional): Like check_cookies. Defaults to False.
+
+    Returns:
+        list: A dict per item in the same order, like
+            {"domain": "jw", "status": "valid", "message": "你好，jw.ruc.edu.cn cookies 有效", "latency": 0.05},
+            status is "valid", "invalid", "timeout" or "error", message is the greeting message
+            of a valid one or what went wrong.
+    """
+    items = list(items)
+    if not items:
+        return []
+    session = get_session(concurrency)
+    settings = http_settings()
+    connect, read = settings["timeout"] if timeout is None else (
+        timeout if isinstance(timeout, tuple) else (timeout, timeout)
+    )
+    # a check can wait that long for every try, plus the backoff between them
+    check_bound = (settings["retries"] + 1) * (connect + read + settings["backoff"] * 2 ** settings["retries"])
+    tic = timer()
+    executor = ThreadPoolExecutor(concurrency)
+    futures = [
+        executor.submit(check_one, session, cookies, domain, detail, timeout)
+        for cookies, domain in items
+    ]
+    rounds = -(-len(items) // concurrency)
+    done, _ = wait(futures, timeout=check_bound * rounds)
+    for future in futures:
+        future.cancel()  # the checks that have not started
+    executor.shutdown(wait=False)
+    results = []
+    for future, (cookies, domain) in zip(futures, items):
+        if future in done:
+            results.append(future.result())
+        else:
+            results.append(
+                {
+                    "domain": domain.split(".")[0],
+                    "status": "timeout",
+                    "message": None,
+                    "latency": timer() - tic,
+                }
+            )
+    return results
+
+
 def update_username_and_password(username: str, password: str):
     """Update username and password, save to disk.
 
+    The cached cookies of the account are removed when its password changes,
+    those of other accounts are kept.
+
     Args:
         username (str): username
         password (str): password
@@ -514,10 +1805,8 @@ def update_username_and_password(username: str, password: str):
     if username or password:
         with open(INI_PATH, "w", encoding="utf-8") as f:
             config.write(f)
-        if osp.exists(JW_COOKIES_PATH):
-            os.remove(JW_COOKIES_PATH)
-        if osp.exists(V_COOKIES_PATH):
-            os.remove(V_COOKIES_PATH)
+    if password:
+        clear_cookies(config.get("base", "username", raw=True))
 
 
 def get_username_and_password():
@@ -531,23 +1820,40 @@ def get_username_and_password():
     return config["base"]["username"], config["base"]["password"]
 
 
-def update_other(browser=None, driver_path=None):
+def update_other(browser=None, driver_path=None, engine=None):
     global config
     config.read(INI_PATH, encoding="utf-8")
+    if browser or driver_path:
+        clear_resolved_driver()
     if browser:
         config["base"]["browser"] = browser
     if driver_path:
         config["base"]["driver"] = driver_path
+    if engine:
+        config["base"]["engine"] = engine
     with open(INI_PATH, "w", encoding="utf-8") as f:
         config.write(f)
 
 
 def main():
-    parser = argparse.ArgumentParser()
+    if sys.argv[1:2] == ["serve"]:
+        from .broker import main as serve
+
+        return serve(sys.argv[2:])
+    if sys.argv[1:2] == ["batch"]:
+        from .batch import main as batch
+
+        return batch(sys.argv[2:])
+    parser = argparse.ArgumentParser(
+        epilog="subcommands: 'ruclogin serve -h' for the cookie broker, 'ruclogin batch -h' to log many accounts in"
+    )
     parser.add_argument("--username", type=str, default=None)
     parser.add_argument("--password", type=str, default=None)
     parser.add_argument("--browser", type=str, default=None)
     parser.add_argument("--driver", type=str, default=None)
+    parser.add_argument(
+        "--engine", type=str, default=None, choices=["selenium", "http"]
+    )
     parser.add_argument("--reset", action="store_true")
     parser.add_argument("--debug", action="store_true")
     parser.add_argument("--no_interactive", action="store_true")
@@ -560,12 +1866,18 @@ def main():
         console_hd.setLevel(PRIVATE_INFO)
     if args.V:
         logger.info(f"配置文件路径：{INI_PATH}")
-        logger.info(f"教务系统 cookies 缓存路径：{JW_COOKIES_PATH}")
-        logger.info(f"信息门户 cookies 缓存路径：{V_COOKIES_PATH}")
+        logger.info(f"教务系统 cookies 缓存路径：{cookies_path('jw')}")
+        logger.info(f"信息门户 cookies 缓存路径：{cookies_path('v')}")
+        logger.info(f"浏览器驱动缓存路径：{resolved_driver_path()}")
         return
     if args.reset:
         update_username_and_password("2021201212", "ABC12345")
-        update_other(browser="Chrome", driver_path="D:/Other/driver/chromedriver.exe")
+        clear_cookies()
+        update_other(
+            browser="Chrome",
+            driver_path="D:/Other/driver/chromedriver.exe",
+            engine="selenium",
+        )
         config.read(INI_PATH, encoding="utf-8")
         logger.info("Config {} updated:".format(INI_PATH))
         logger.private_info(
@@ -576,8 +1888,7 @@ def main():
                 config["base"]["driver"],
             )
         )
-        assert not osp.exists(JW_COOKIES_PATH)
-        assert not osp.exists(V_COOKIES_PATH)
+        assert not glob(osp.join(ROOT, "*_cookies*.pkl"))
         return
     restart = True
     retry = 0
@@ -593,7 +1904,11 @@ def main():
             raise ValueError("browser must be Chrome or Edge")
         driver_path = args.driver or input("driver_path, type enter to skip: ")
         update_username_and_password(username, password)
-        update_other(browser, driver_path)
+        update_other(browser, driver_path, args.engine)
+        selenium = config["base"].get("engine", "selenium") == "selenium"
+        if selenium:
+            # start the browser while the user reads the config and answers the prompt
+            warmup = driver_init(args.debug, background=True)
         if args.no_interactive:
             isTest = "y"
         else:
@@ -616,19 +1931,21 @@ def main():
             logger.info("Testing, please be patient and wait...")
             try:
                 init_tic = timer()
-                driver_init(args.debug)
+                if selenium:
+                    warmup.result()
                 init_toc = timer()
                 logger.info("Driver init time: {:.3f}s".format(init_toc - init_tic))
-                v_get_tic = timer()
-                v_cookies = get_cookies(domain="v", cache=False)
-                v_get_toc = timer()
+                get_tic = timer()
+                all_cookies = get_all_cookies(domains=["v", "jw"], cache=False)
+                v_cookies, jw_cookies = all_cookies["v"], all_cookies["jw"]
+                get_toc = timer()
                 logger.info(
-                    "v.ruc.edu.cn get cookies time: {:.3f}s".format(
-                        v_get_toc - v_get_tic
+                    "v.ruc.edu.cn and jw.ruc.edu.cn get cookies time: {:.3f}s".format(
+                        get_toc - get_tic
                     )
                 )
                 v_check_tic = timer()
-                v_msg = check_cookies(v_cookies, domain="v")
+                v_msg = check_cookies(v_cookies, domain="v", detail=True)
                 if not v_msg:
                     logger.error(f"v.ruc.edu.cn cookies are invalid")
                     logger.private_info(f"v_cookies: {v_cookies}")
@@ -640,16 +1957,8 @@ def main():
                         v_check_toc - v_check_tic
                     )
                 )
-                jw_get_tic = timer()
-                jw_cookies = get_cookies(domain="jw", cache=False)
-                jw_get_toc = timer()
-                logger.info(
-                    "jw.ruc.edu.cn get cookies time: {:.3f}s".format(
-                        jw_get_toc - jw_get_tic
-                    )
-                )
                 jw_check_tic = timer()
-                jw_msg = check_cookies(jw_cookies, domain="jw")
+                jw_msg = check_cookies(jw_cookies, domain="jw", detail=True)
                 if not jw_msg:
                     logger.error(f"jw.ruc.edu.cn cookies are invalid: {jw_cookies}")
                     logger.private_info(f"jw_cookies: {jw_cookies}")